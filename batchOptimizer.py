@@ -0,0 +1,188 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+from multiprocessing import freeze_support
+from headings import parseHeading
+from lapOutput import saveLap
+from runMetrics import metricsReport, resetMetrics, writeMetrics
+from trackAnalyzer import showPath
+from trackKernels import buildTrack, buildTrackGrid, findLap, directions, moveOffset, pathLength, trackClearance
+
+# Direction names from the interactive menu mapped to their moves
+directionMoves = {name: move for name, move in directions.values()}
+
+def parseDirection(direction):
+    """
+    Converts a manifest direction into a heading ID.
+
+    Parameters:
+    - direction (str or int): Cardinal direction such as 'NE', a move string such as '0101' or a heading ID.
+
+    Returns:
+    - int: Heading ID for the direction.
+    """
+
+    if isinstance(direction, str) and direction.upper() in directionMoves:
+        direction = directionMoves[direction.upper()]
+    return parseHeading(direction)
+
+def loadManifest(manifestPath):
+    """
+    Loads the list of jobs to run from a JSON manifest.
+
+    Each job needs a 'track' (image filename in the tracks folder), 'size', 'x', 'y' and 'direction',
+    and may set 'mode' to 'greedy', 'skeleton', 'multiresolution', 'bidirectional' or 'optimal' (the default) and 'renders' to a list of 'gif', 'png', 'svg' or 'pdf'
+    and 'minClearance' to the distance in track nodes the lap keeps from the track edge.
+
+    Parameters:
+    - manifestPath (str): Path to the manifest file, either a list of jobs or an object with a 'jobs' list.
+
+    Returns:
+    - list: List of job dictionaries.
+    """
+
+    with open(manifestPath) as manifestFile:
+        manifest = json.load(manifestFile)
+
+    jobs = manifest['jobs'] if isinstance(manifest, dict) else manifest
+    for index, job in enumerate(jobs):
+        missing = [key for key in ('track', 'size', 'x', 'y', 'direction') if key not in job]
+        if missing:
+            raise ValueError(f'Job {index} is missing {", ".join(missing)}.')
+    return jobs
+
+# Batch workers never show figures, so they render on Agg even when a display is available.
+# Set in each worker rather than on import so processes that only import this module keep their own backend
+def initWorker():
+    os.environ['RACELINE_HEADLESS'] = '1'
+
+def runJob(index, job, tracksFolder, outputFolder, lapFormats=('csv',), renders=(), smoothSpacing=None):
+    """
+    Builds and searches a single track, writing the lap it finds and its renders to the output folder.
+
+    Parameters:
+    - index (int): Position of the job in the manifest.
+    - job (dict): Job from the manifest.
+    - tracksFolder (str): Folder containing the track images.
+    - outputFolder (str): Folder the lap is written to.
+    - lapFormats (tuple): Formats the lap is written in, 'csv' or 'npz'. Defaults to CSV.
+    - renders (tuple): Formats the lap is rendered in when the job does not set its own. Defaults to none.
+    - smoothSpacing (float): Distance in track nodes between the points of the smoothed lap that is written instead of every grid node. Defaults to writing the grid lap.
+
+    Returns:
+    - dict: Summary of the job with its timings, its metrics and where the lap was written.
+    """
+
+    summary = dict(job, index=index)
+    startTime = time.time()
+    resetMetrics()
+    try:
+        direction = parseDirection(job['direction'])
+        mode = job.get('mode', 'optimal')
+
+        imagePath = os.path.join(tracksFolder, job['track'])
+        xCoords, yCoords, total_nodes = buildTrack(imagePath, job['size'])
+        trackGrid = buildTrackGrid(xCoords, yCoords)
+        minClearance = job.get('minClearance', 0)
+        clearance = trackClearance(trackGrid, imagePath, job['size']) if minClearance else None
+        buildTime = time.time()
+
+        results = findLap(job['x'], job['y'], direction, trackGrid, mode, clearance, minClearance)
+        searchTime = time.time()
+
+        summary.update(trackNodes=total_nodes, buildTime=round(buildTime - startTime, 4), searchTime=round(searchTime - buildTime, 4))
+
+        if results is None:
+            summary.update(status='no lap', pathNodes=None, pathFile=None)
+        else:
+            trackName = os.path.splitext(job['track'])[0]
+            name = f'{index:03d}_{trackName}_{job["size"]}'
+            if smoothSpacing:
+                # Smoothing needs SciPy, which only jobs that write smooth laps import
+                from raceline import smoothLap
+                smoothX, smoothY, lapLength = smoothLap(results[0], results[1], smoothSpacing)
+                files = saveLap(smoothX, smoothY, name, outputFolder, lapFormats)
+            else:
+                lapLength = pathLength(results[0], results[1])
+                files = saveLap(results[0], results[1], name, outputFolder, lapFormats)
+
+            jobRenders = job.get('renders', renders)
+            if jobRenders:
+                j, i = moveOffset(direction)
+                files += showPath(list(results[0]), list(results[1]), xCoords, yCoords, job['x']+j, job['y']+i, len(results[0]), name, outputFolder, jobRenders)
+
+            summary.update(status='ok', pathNodes=len(results[0]), lapLength=round(lapLength, 2), pathFile=os.path.basename(files[0]), files=[os.path.basename(path) for path in files])
+    except Exception as e:
+        summary.update(status='error', error=str(e))
+
+    summary['totalTime'] = round(time.time() - startTime, 4)
+    summary['metrics'] = metricsReport()
+    return summary
+
+def runBatch(jobs, tracksFolder='tracks', outputFolder='batchResults', workers=None, lapFormats=('csv',), renders=(), smoothSpacing=None):
+    """
+    Runs every job across a process pool, one track per worker, and writes a summary of the results.
+
+    Parameters:
+    - jobs (list): List of job dictionaries from loadManifest.
+    - tracksFolder (str): Folder containing the track images. Defaults to 'tracks'.
+    - outputFolder (str): Folder the laps and summary are written to. Defaults to 'batchResults'.
+    - workers (int): Number of worker processes. Defaults to the number of CPUs.
+    - lapFormats (tuple): Formats each lap is written in, 'csv' or 'npz'. Defaults to CSV.
+    - renders (tuple): Formats each lap is rendered in unless its job sets 'renders'. Defaults to none.
+    - smoothSpacing (float): Distance in track nodes between the points of the smoothed laps written instead of the grid laps. Defaults to writing the grid laps.
+
+    Returns:
+    - list: Job summaries in manifest order.
+    """
+
+    os.makedirs(outputFolder, exist_ok=True)
+    startTime = time.time()
+
+    summaries = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initWorker) as executor:
+        futures = [executor.submit(runJob, index, job, tracksFolder, outputFolder, lapFormats, renders, smoothSpacing) for index, job in enumerate(jobs)]
+        for future in concurrent.futures.as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            # Workers only send their metrics back, so the file is only ever appended to from here
+            writeMetrics({key: value for key, value in summary.items() if key != 'metrics'}, report=summary['metrics'])
+            print(f"[{len(summaries)}/{len(jobs)}] {summary['track']} at {summary['size']}: {summary['status']} in {summary['totalTime']} seconds.")
+
+    summaries.sort(key=lambda summary: summary['index'])
+    with open(os.path.join(outputFolder, 'results.json'), 'w') as resultsFile:
+        json.dump({'wallTime': round(time.time() - startTime, 4), 'jobs': summaries}, resultsFile, indent=2)
+
+    return summaries
+
+def main():
+    """
+    Command line entry point for running a manifest of tracks without any prompts.
+
+    Returns:
+    - None
+    """
+
+    parser = argparse.ArgumentParser(description='Optimize a manifest of tracks in parallel without any prompts.')
+    parser.add_argument('manifest', help='JSON manifest of jobs with track, size, x, y, direction and optional mode.')
+    parser.add_argument('--tracks', default='tracks', help='Folder containing the track images.')
+    parser.add_argument('--output', default='batchResults', help='Folder to write laps and results.json to.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes, defaults to the number of CPUs.')
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'npz'], default=['csv'], help='Formats to write each lap in.')
+    parser.add_argument('--renders', nargs='*', choices=['gif', 'png', 'svg', 'pdf'], default=[], help='Formats to render each lap in.')
+    parser.add_argument('--smooth', type=float, metavar='SPACING', help='Write each lap as a smooth curve with a point every SPACING nodes instead of every grid node.')
+    args = parser.parse_args()
+
+    startTime = time.time()
+    summaries = runBatch(loadManifest(args.manifest), args.tracks, args.output, args.workers, args.formats, args.renders, args.smooth)
+    endTime = time.time()
+
+    found = sum(summary['status'] == 'ok' for summary in summaries)
+    print(f'\nFound laps for {found} of {len(summaries)} tracks.')
+    print(f'Wait time was: {round(endTime-startTime,2)} seconds.')
+
+if __name__ == "__main__":
+    freeze_support()
+    main()
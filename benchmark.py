@@ -0,0 +1,317 @@
+import matplotlib
+matplotlib.use('Agg')
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from multiprocessing import Pipe, Process, freeze_support
+import numpy as np
+from PIL import Image
+from headings import headingIds
+import randomWalks
+import trackAnalyzer
+import trackKernels
+from raceline import minimumCurvatureLine
+
+# Stages that can be measured, in the order they run
+stages = ['extraction', 'extraction-pool', 'search-greedy', 'search-optimal', 'search-skeleton', 'search-multiresolution', 'search-bidirectional', 'search-random', 'search-random-batch', 'raceline', 'render']
+
+def pickStart(trackGrid):
+    """
+    Picks a start point and direction that a closed lap exists for, so every run of a track starts from the same place.
+
+    The track runs sideways through its lowest and highest nodes and up and down through its leftmost and rightmost ones,
+    so the middle of the track at each of those is tried in both directions.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - tuple: A tuple containing the X and Y coordinates of the start point and its heading ID.
+    """
+
+    trackX, trackY = np.nonzero(trackGrid)
+    east, west, north, south = (headingIds[move] for move in ('0001', '0011', '0100', '1100'))
+    extremes = [
+        (trackY.argmin(), (0, 1), (east, west)),
+        (trackY.argmax(), (0, -1), (east, west)),
+        (trackX.argmin(), (1, 0), (north, south)),
+        (trackX.argmax(), (-1, 0), (north, south)),
+    ]
+
+    for extreme, (stepX, stepY), moves in extremes:
+        x = int(trackX[extreme])
+        y = int(trackY[extreme])
+
+        # Walk across the track to find its middle
+        width = 0
+        while trackGrid[x + stepX * width, y + stepY * width]:
+            width += 1
+        x += stepX * (width // 2)
+        y += stepY * (width // 2)
+
+        for move in moves:
+            if trackKernels.findShortestLap(x, y, move, trackGrid) is not None:
+                return x, y, move
+
+    raise ValueError('No start point with a closed lap was found.')
+
+def poolExtraction(imagePath, size):
+    """
+    Extracts the track mask tile by tile over a multiprocessing Pool the way buildTrack does for large sizes.
+
+    Parameters:
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+
+    Returns:
+    - int: Number of track nodes.
+    """
+
+    return int(np.count_nonzero(trackKernels.extractTrackMask(imagePath, size, processes=max(os.cpu_count(), 2))))
+
+def prepareStage(stage, imagePath, size, outputFolder):
+    """
+    Builds everything a stage needs outside of the measured region.
+
+    Parameters:
+    - stage (str): Stage to prepare.
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - outputFolder (str): Folder the render stage saves its animation to.
+
+    Returns:
+    - function: Function that runs the stage once and returns the number of nodes it produced.
+    """
+
+    img = Image.open(imagePath).resize((size, size), resample=Image.BOX)
+
+    if stage == 'extraction':
+        return lambda: trackKernels.processImageSection([img, (size, size), (0, 0)])[2]
+    if stage == 'extraction-pool':
+        return lambda: poolExtraction(imagePath, size)
+
+    xCoords, yCoords, total_nodes = trackKernels.processImageSection([img, (size, size), (0, 0)])
+    trackGrid = trackKernels.buildTrackGrid(xCoords, yCoords)
+    x, y, direction = pickStart(trackGrid)
+    j, i = trackKernels.moveOffset(direction)
+
+    if stage in ('search-greedy', 'search-optimal', 'search-skeleton', 'search-multiresolution', 'search-bidirectional'):
+        mode = stage.split('-')[1]
+        def search():
+            results = trackKernels.findLap(x, y, direction, trackGrid, mode)
+            return 0 if results is None else len(results[0])
+        return search
+
+    if stage == 'search-random':
+        def search():
+            # Reseed so every repeat walks the same paths
+            random.seed(0)
+            path, nodeCount = randomWalks.findStart(x, y, direction, x+j, y+i, trackGrid, total_nodes*.5, 0)
+            return 0 if path is None else nodeCount
+        return search
+
+    if stage == 'search-random-batch':
+        def search():
+            path, nodeCount = randomWalks.findStartBatch(x, y, direction, x+j, y+i, trackGrid, total_nodes*.5, 0, seed=0)
+            return 0 if path is None else nodeCount
+        return search
+
+    path = trackKernels.findShortestLap(x, y, direction, trackGrid)
+    if stage == 'raceline':
+        return lambda: len(minimumCurvatureLine(path[0], path[1], trackGrid)[0])
+
+    def render():
+        trackAnalyzer.showPath(list(path[0]), list(path[1]), xCoords, yCoords, x+j, y+i, len(path[0]), 'benchmark', outputFolder, ('gif',))
+        return len(path[0])
+    return render
+
+def measureStage(stage, imagePath, size, repeat, connection):
+    """
+    Measures a stage in its own process and sends the result back over a pipe.
+
+    Wall time is the fastest of the repeats, peak memory comes from one extra run under tracemalloc
+    so tracing never slows down the timed runs.
+
+    Parameters:
+    - stage (str): Stage to measure.
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - repeat (int): Number of timed runs.
+    - connection (multiprocessing.connection.Connection): Pipe to send the result over.
+
+    Returns:
+    - None
+    """
+
+    # Keep the progress prints of the stages out of the report
+    sys.stdout = open(os.devnull, 'w')
+
+    try:
+        with tempfile.TemporaryDirectory() as tempFolder:
+            run = prepareStage(stage, imagePath, size, tempFolder)
+
+            times = []
+            for _ in range(repeat):
+                startTime = time.perf_counter()
+                nodes = run()
+                times.append(time.perf_counter() - startTime)
+
+            tracemalloc.start()
+            run()
+            peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        wallTime = min(times)
+        result = {
+            'status': 'ok',
+            'wallTime': round(wallTime, 6),
+            'peakMemory': peakMemory,
+            'nodes': nodes,
+            'nodesPerSecond': round(nodes / wallTime, 2) if wallTime > 0 else None,
+        }
+    except Exception as e:
+        result = {'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+
+    connection.send(result)
+
+def runBenchmark(imagePaths, sizes, stageNames, repeat=3, timeout=600):
+    """
+    Measures every stage for every track and size, each in a fresh process so stages never share caches or memory.
+
+    Parameters:
+    - imagePaths (list): Paths to the track images.
+    - sizes (list): Sizes to scale the images to.
+    - stageNames (list): Stages to measure.
+    - repeat (int): Number of timed runs per stage. Defaults to 3.
+    - timeout (float): Seconds a stage may take before it is stopped and reported as a timeout. Defaults to 600.
+
+    Returns:
+    - list: One result dictionary per track, size and stage.
+    """
+
+    results = []
+    for imagePath in imagePaths:
+        trackName = os.path.splitext(os.path.basename(imagePath))[0]
+        for size in sizes:
+            for stage in stageNames:
+                receiver, sender = Pipe(duplex=False)
+                process = Process(target=measureStage, args=(stage, imagePath, size, repeat, sender))
+                process.start()
+
+                if receiver.poll(timeout):
+                    result = receiver.recv()
+                else:
+                    process.terminate()
+                    result = {'status': 'timeout'}
+                process.join()
+
+                result = dict({'track': trackName, 'size': size, 'stage': stage}, **result)
+                results.append(result)
+                printResult(result)
+    return results
+
+def printResult(result):
+    """
+    Prints one benchmark result as a row of the report.
+
+    Parameters:
+    - result (dict): Result from runBenchmark.
+
+    Returns:
+    - None
+    """
+
+    name = f"{result['track']} {result['size']} {result['stage']}"
+    if result['status'] != 'ok':
+        print(f"{name:<40} {result['status']} {result.get('error', '')}")
+    else:
+        nodesPerSecond = '-' if result['nodesPerSecond'] is None else '{:,.0f}'.format(result['nodesPerSecond'])
+        print(f"{name:<40} {result['wallTime']:>10.4f} s {result['peakMemory'] / (1024 * 1024):>9.2f} MB {nodesPerSecond:>14} nodes/s")
+
+def compareResults(results, baseline, tolerance):
+    """
+    Compares results against a stored baseline and reports every stage that got slower or used more memory.
+
+    Parameters:
+    - results (list): Results from runBenchmark.
+    - baseline (list): Results loaded from a previous benchmark report.
+    - tolerance (float): Fraction a metric may grow by before it counts as a regression.
+
+    Returns:
+    - list: Descriptions of the regressions found.
+    """
+
+    baselineResults = {(result['track'], result['size'], result['stage']): result for result in baseline}
+
+    regressions = []
+    for result in results:
+        previous = baselineResults.get((result['track'], result['size'], result['stage']))
+        if previous is None:
+            continue
+        name = f"{result['track']} {result['size']} {result['stage']}"
+        if previous['status'] == 'ok' and result['status'] != 'ok':
+            regressions.append(f"{name}: {result['status']}, was ok")
+            continue
+        if previous['status'] != 'ok' or result['status'] != 'ok':
+            continue
+        for metric in ('wallTime', 'peakMemory'):
+            if previous[metric] and result[metric] > previous[metric] * (1 + tolerance):
+                change = (result[metric] / previous[metric] - 1) * 100
+                regressions.append(f'{name}: {metric} {previous[metric]} -> {result[metric]} (+{round(change, 1)}%)')
+    return regressions
+
+def main():
+    """
+    Command line entry point for the benchmark suite.
+
+    Returns:
+    - None
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark extraction, search and rendering over the bundled tracks.')
+    parser.add_argument('--tracks', nargs='+', help='Track images to benchmark, defaults to every jpg in the tracks folder.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 200], help='Sizes to scale each track to.')
+    parser.add_argument('--stages', nargs='+', choices=stages, default=stages, help='Stages to measure.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage, the fastest is reported.')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds a stage may take before it is stopped.')
+    parser.add_argument('--output', default='benchmark.json', help='Path to write the JSON report to.')
+    parser.add_argument('--compare', help='Baseline JSON report to flag regressions against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Fraction a metric may grow by before it is a regression.')
+    args = parser.parse_args()
+
+    imagePaths = args.tracks or sorted(glob.glob(os.path.join('tracks', '*.jpg')))
+
+    results = runBenchmark(imagePaths, args.sizes, args.stages, args.repeat, args.timeout)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpuCount': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w') as reportFile:
+        json.dump(report, reportFile, indent=2)
+    print(f'\nReport written to {args.output}.')
+
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)['results']
+        regressions = compareResults(results, baseline, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regressions against {args.compare}:')
+            for regression in regressions:
+                print(f'- {regression}')
+            sys.exit(1)
+        print(f'\nNo regressions against {args.compare}.')
+
+if __name__ == "__main__":
+    freeze_support()
+    main()
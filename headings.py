@@ -0,0 +1,46 @@
+import numpy as np
+
+# Move strings headings are written as in menus and manifests, the position of each is its heading ID.
+# A move string is a sign and a step for Y followed by a sign and a step for X, so '1101' steps down and right
+moveCodes = ['0111', '0100', '0101', '0011', '0001', '1111', '1100', '1101']
+headingIds = {move: heading for heading, move in enumerate(moveCodes)}
+
+# X and Y step of every heading
+headingX = tuple(int(move[3]) * (-1 if int(move[2]) else 1) for move in moveCodes)
+headingY = tuple(int(move[1]) * (-1 if int(move[0]) else 1) for move in moveCodes)
+
+# Headings each heading can move to next, turning one step either way or going straight on, straight on is always in the middle
+nextHeadings = (
+    (3, 0, 1),
+    (0, 1, 2),
+    (1, 2, 4),
+    (5, 3, 0),
+    (2, 4, 7),
+    (3, 5, 6),
+    (5, 6, 7),
+    (6, 7, 4),
+)
+
+# Heading pointing the other way from every heading
+oppositeHeadings = (7, 6, 5, 4, 3, 2, 1, 0)
+
+# The same tables as arrays, for searches that move many walkers at once
+headingSteps = np.array([headingX, headingY]).T
+headingTurns = np.array(nextHeadings)
+
+def parseHeading(direction):
+    """
+    Converts a direction given by the user or a manifest into a heading ID.
+
+    Parameters:
+    - direction (int or str): Heading ID, or move string such as '0101'.
+
+    Returns:
+    - int: Heading ID from 0 to 7.
+    """
+
+    if direction in headingIds:
+        return headingIds[direction]
+    if isinstance(direction, (int, np.integer)) and 0 <= direction < len(moveCodes):
+        return int(direction)
+    raise ValueError(f'Unknown direction {direction!r}.')
@@ -0,0 +1,158 @@
+import json
+import os
+import time
+import numpy as np
+
+# Folder every run writes its laps and renders to, and what each run writes by default
+outputFolder = 'output'
+lapFormats = ('npz', 'csv')
+renderFormats = ('gif', 'png')
+
+# Backends that only draw to files
+nonInteractiveBackends = ('agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template')
+
+def pyplot():
+    """
+    Imports matplotlib's pyplot on first use, so processes that only extract or search tracks never load matplotlib.
+
+    Set RACELINE_HEADLESS to render on the Agg backend, nothing is shown and no display is needed.
+
+    Returns:
+    - module: matplotlib.pyplot.
+    """
+
+    import matplotlib
+    if os.environ.get('RACELINE_HEADLESS'):
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def isHeadless():
+    """
+    Checks whether figures can only be saved because the backend has no window to show them in.
+
+    Returns:
+    - bool: True if the current matplotlib backend is non-interactive.
+    """
+
+    return pyplot().get_backend().lower() in nonInteractiveBackends
+
+def runName(*parts):
+    """
+    Builds a filename for one run that no other run, in this process or another, will share.
+
+    Parameters:
+    - *parts: Values describing the run, such as the track, size and search mode.
+
+    Returns:
+    - str: Name made of the parts, a timestamp and the process ID.
+    """
+
+    now = time.time()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f'{int(now * 1000) % 1000:03d}'
+    return '_'.join([str(part) for part in parts] + [stamp, str(os.getpid())])
+
+def saveLap(xPath, yPath, name, folder=outputFolder, formats=lapFormats, info=None):
+    """
+    Writes a lap as structured data.
+
+    'npz' stores the X and Y coordinates as arrays, 'csv' stores them as x,y rows. Laps on the grid are stored as
+    int32 and smooth racelines as float64.
+
+    Parameters:
+    - xPath (list): List of X-coordinates representing the path.
+    - yPath (list): List of Y-coordinates representing the path.
+    - name (str): Filename of the lap without an extension.
+    - folder (str): Folder the lap is written to. Defaults to outputFolder.
+    - formats (tuple): Formats to write. Defaults to lapFormats.
+    - info (dict): Details of the run written next to the lap as JSON. Nothing is written if None.
+
+    Returns:
+    - list: Paths of the files written.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    dtype = np.int32 if np.issubdtype(np.asarray(xPath).dtype, np.integer) else np.float64
+    xPath = np.asarray(xPath, dtype=dtype)
+    yPath = np.asarray(yPath, dtype=dtype)
+
+    paths = []
+    for lapFormat in formats:
+        path = os.path.join(folder, f'{name}.{lapFormat}')
+        if lapFormat == 'npz':
+            np.savez(path, x=xPath, y=yPath)
+        elif lapFormat == 'csv':
+            with open(path, 'w') as csvFile:
+                csvFile.write('x,y\n')
+                csvFile.writelines(f'{pathX},{pathY}\n' for pathX, pathY in zip(xPath.tolist(), yPath.tolist()))
+        else:
+            raise ValueError(f'Unknown lap format {lapFormat!r}.')
+        paths.append(path)
+
+    if info is not None:
+        path = os.path.join(folder, f'{name}.json')
+        with open(path, 'w') as infoFile:
+            json.dump(dict(info, nodes=len(xPath), files=[os.path.basename(lapPath) for lapPath in paths]), infoFile, indent=2)
+        paths.append(path)
+
+    return paths
+
+def loadLap(path):
+    """
+    Reads a lap written by saveLap.
+
+    Parameters:
+    - path (str): Path to an 'npz' or 'csv' lap.
+
+    Returns:
+    - tuple: A tuple containing the X and Y coordinates of the path, int32 arrays for a lap on the grid and float64 for a raceline.
+    """
+
+    if path.endswith('.npz'):
+        with np.load(path) as lap:
+            return lap['x'], lap['y']
+
+    lap = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+    if np.array_equal(lap, np.round(lap)):
+        lap = lap.astype(np.int32)
+    return lap[:, 0], lap[:, 1]
+
+def saveFigure(fig, name, folder=outputFolder, formats=renderFormats):
+    """
+    Saves a figure in every image format asked for, formats matplotlib can not write such as 'gif' are skipped.
+
+    Parameters:
+    - fig (matplotlib.figure.Figure): Figure to save.
+    - name (str): Filename of the figure without an extension.
+    - folder (str): Folder the figure is written to. Defaults to outputFolder.
+    - formats (tuple): Formats to write. Defaults to renderFormats.
+
+    Returns:
+    - list: Paths of the files written.
+    """
+
+    paths = []
+    for imageFormat in formats:
+        if imageFormat in ('png', 'svg', 'pdf'):
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f'{name}.{imageFormat}')
+            fig.savefig(path)
+            paths.append(path)
+    return paths
+
+def finishFigure(fig=None):
+    """
+    Shows a figure when there is a window to show it in, otherwise closes it so headless runs never block or leak figures.
+
+    Parameters:
+    - fig (matplotlib.figure.Figure): Figure to finish. Defaults to the current figure.
+
+    Returns:
+    - None
+    """
+
+    plt = pyplot()
+    if isHeadless():
+        plt.close(fig if fig is not None else plt.gcf())
+    else:
+        plt.show()
@@ -0,0 +1,226 @@
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+from multiprocessing import freeze_support
+from headings import headingIds, moveCodes, nextHeadings
+from lapOutput import outputFolder, runName, saveLap
+from runMetrics import mergeMetrics, metricsReport, resetMetrics, stage, writeMetrics
+from sharedTrack import attachTrackGrid, shareTrackGrid
+from trackKernels import directions, findLap, pathLength, startLine
+from trackSession import TrackSession
+
+# Search modes that can be fanned out, bidirectional is left out since every one of its searches already runs on two processes
+# and greedy since its walks can run forever, which would stall the whole pool
+searchModes = ('optimal', 'skeleton', 'multiresolution')
+
+# State each worker of the pool is started with, the shared track grid and what the searches built from it
+workerState = {}
+
+# Cardinal names from the interactive menu by heading ID, and the heading ID of each name
+headingNames = {headingIds[move]: name for name, move in directions.values()}
+nameHeadings = {name: heading for heading, name in headingNames.items()}
+
+def candidateStarts(x, y, direction, trackGrid, headings=None, radius=None, stride=1):
+    """
+    Lists the start points and headings to search from, either along the start/finish line or over a square region.
+
+    Parameters:
+    - x (int): X-coordinate of the start point the candidates are taken around.
+    - y (int): Y-coordinate of the start point the candidates are taken around.
+    - direction (int): Heading of travel over the start/finish line.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - headings (list): Heading IDs to search from every start point. Defaults to the direction and the headings one turn either side of it.
+    - radius (int): Half the width of the square region around the start point to take start points from. Defaults to the whole start/finish line.
+    - stride (int): Distance in track nodes between the start points taken. Defaults to every node.
+
+    Returns:
+    - list: Tuples of the X and Y coordinates and heading ID of every candidate start.
+    """
+
+    if headings is None:
+        headings = nextHeadings[direction]
+
+    if radius is None:
+        points = sorted(startLine(x, y, direction, trackGrid))
+        # Every stride-th node across the line from the start point is kept
+        points = [(pointX, pointY) for pointX, pointY in points if max(abs(pointX - x), abs(pointY - y)) % stride == 0]
+    else:
+        width, height = trackGrid.shape
+        points = [(pointX, pointY)
+                  for pointX in range(max(x - radius, 0), min(x + radius + 1, width), stride)
+                  for pointY in range(max(y - radius, 0), min(y + radius + 1, height), stride)
+                  if trackGrid[pointX, pointY]]
+
+    return [(pointX, pointY, heading) for pointX, pointY in points for heading in headings]
+
+def initWorker(gridHandle):
+    """
+    Starts a worker of the pool on the shared track grid, with an empty cache for what its searches build from the grid.
+
+    Parameters:
+    - gridHandle (tuple): Name, shape and dtype of the shared grid from shareTrackGrid.
+
+    Returns:
+    - None
+    """
+
+    # The searches print their progress, which would only interleave between the workers
+    sys.stdout = open(os.devnull, 'w')
+    workerState['trackGrid'] = attachTrackGrid(gridHandle)
+    workerState['searchCache'] = {}
+
+def searchStart(x, y, direction, mode):
+    """
+    Worker entry point that searches one candidate start on the shared track grid.
+    The skeleton graph and coarse grids are built once per worker and kept for its later starts.
+
+    Parameters:
+    - x (int): X-coordinate of the start point.
+    - y (int): Y-coordinate of the start point.
+    - direction (int): Heading ID to search from the start point.
+    - mode (str): Search mode, either 'optimal', 'skeleton' or 'multiresolution'.
+
+    Returns:
+    - tuple: The lap found or None, the error the search raised or None, and the metrics of the search.
+    """
+
+    resetMetrics()
+    try:
+        lap = findLap(x, y, direction, workerState['trackGrid'], mode, searchCache=workerState['searchCache'])
+        error = None
+    except Exception as e:
+        lap = None
+        error = f'{type(e).__name__}: {e}'
+    return lap, error, metricsReport()
+
+def findBestLap(trackGrid, candidates, mode='optimal', workers=None):
+    """
+    Searches every candidate start across a process pool and ranks the laps found, shortest first.
+
+    The track grid is put in shared memory once and every worker attaches to it, so memory does not grow with the number of candidates.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - candidates (list): Start points and heading IDs from candidateStarts.
+    - mode (str): Search mode, either 'optimal', 'skeleton' or 'multiresolution'. Defaults to 'optimal'.
+    - workers (int): Number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+    - tuple: The ranked results as dictionaries with the start, heading, node count, length and lap of every candidate a lap was found from,
+      and the number of candidates that found no lap.
+    """
+
+    sharedGrid, gridHandle = shareTrackGrid(trackGrid)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(gridHandle,))
+
+    ranked = []
+    failed = 0
+    with stage('search'):
+        try:
+            futures = {executor.submit(searchStart, x, y, direction, mode): (x, y, direction) for x, y, direction in candidates}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                x, y, direction = futures[future]
+                lap, error, workerMetrics = future.result()
+                mergeMetrics(workerMetrics)
+                if lap is None:
+                    failed += 1
+                    if error:
+                        print(f'[{done}/{len(candidates)}] ({x}, {y}) {headingNames[direction]}: {error}')
+                    continue
+                ranked.append({'x': x, 'y': y, 'direction': direction, 'nodes': len(lap[0]), 'length': round(pathLength(lap[0], lap[1]), 2), 'lap': lap})
+                print(f'[{done}/{len(candidates)}] ({x}, {y}) {headingNames[direction]}: {len(lap[0])} nodes')
+        finally:
+            executor.shutdown(cancel_futures=True)
+            sharedGrid.close()
+            sharedGrid.unlink()
+
+    # Laps of the same length are ordered by start so repeated runs rank them the same way
+    ranked.sort(key=lambda result: (result['length'], result['nodes'], result['x'], result['y'], result['direction']))
+    return ranked, failed
+
+def printRanking(ranked, top=10):
+    """
+    Prints the best laps found as a ranked table.
+
+    Parameters:
+    - ranked (list): Ranked results from findBestLap.
+    - top (int): Number of laps to print. Defaults to 10.
+
+    Returns:
+    - None
+    """
+
+    print(f"\n{'Rank':>4} {'X':>6} {'Y':>6} {'Direction':>9} {'Nodes':>7} {'Length':>9}")
+    for rank, result in enumerate(ranked[:top], 1):
+        print(f"{rank:>4} {result['x']:>6} {result['y']:>6} {headingNames[result['direction']]:>9} {result['nodes']:>7} {result['length']:>9.2f}")
+
+def main():
+    """
+    Command line entry point for searching many start points and headings at once and keeping the shortest lap.
+
+    Returns:
+    - None
+    """
+
+    parser = argparse.ArgumentParser(description='Search a track from every start point on the start/finish line or in a region, in parallel, and keep the shortest lap.')
+    parser.add_argument('track', help='Track image to search.')
+    parser.add_argument('size', type=int, help='Size to scale the image to.')
+    parser.add_argument('x', type=int, help='X coordinate of a point on the start/finish line.')
+    parser.add_argument('y', type=int, help='Y coordinate of a point on the start/finish line.')
+    parser.add_argument('direction', choices=list(nameHeadings), help='Cardinal direction of travel over the line.')
+    parser.add_argument('--headings', nargs='+', choices=list(nameHeadings), help='Headings to search from every start point, defaults to the direction and one turn either side of it.')
+    parser.add_argument('--radius', type=int, help='Search every start point within this many nodes of X and Y instead of the start/finish line.')
+    parser.add_argument('--stride', type=int, default=1, help='Distance in nodes between the start points searched.')
+    parser.add_argument('--mode', choices=searchModes, default='optimal', help='Search mode to run from every start point.')
+    parser.add_argument('--clearance', type=float, default=0, help='Distance in nodes every lap keeps from the track edge.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes, defaults to the number of CPUs.')
+    parser.add_argument('--top', type=int, default=10, help='Number of laps to list in the ranking.')
+    parser.add_argument('--output', default=outputFolder, help='Folder to write the best lap to.')
+    args = parser.parse_args()
+
+    startTime = time.time()
+    resetMetrics()
+
+    session = TrackSession(args.track, args.size)
+    trackGrid = session.trackGrid
+    if args.clearance > 0:
+        # Narrowed once here so the workers share the grid they search instead of each building it
+        trackGrid = trackGrid & (session.clearance >= args.clearance)
+
+    direction = nameHeadings[args.direction]
+    headings = None if args.headings is None else [nameHeadings[heading] for heading in args.headings]
+    candidates = candidateStarts(args.x, args.y, direction, trackGrid, headings, args.radius, args.stride)
+    if not candidates:
+        print('No start points on the track to search from.')
+        return
+
+    print(f'\nSearching {len(candidates)} starts...\n')
+    ranked, failed = findBestLap(trackGrid, candidates, args.mode, args.workers)
+    endTime = time.time()
+
+    print(f'\nFound laps from {len(ranked)} of {len(candidates)} starts, {failed} found none.')
+    print(f'Wait time was: {round(endTime-startTime,2)} seconds.')
+
+    trackName = os.path.splitext(os.path.basename(args.track))[0]
+    runInfo = {'track': os.path.basename(args.track), 'size': args.size, 'mode': args.mode, 'minClearance': args.clearance, 'starts': len(candidates), 'searchTime': round(endTime - startTime, 4)}
+    if not ranked:
+        writeMetrics(runInfo)
+        return
+
+    printRanking(ranked, args.top)
+
+    best = ranked[0]
+    name = runName(trackName, args.size, 'multistart')
+    ranking = [{key: value for key, value in result.items() if key != 'lap'} for result in ranked]
+    for result in ranking:
+        result['direction'] = moveCodes[result['direction']]
+    runInfo.update(startX=best['x'], startY=best['y'], direction=moveCodes[best['direction']], lapLength=best['length'], ranking=ranking, metrics=metricsReport())
+    saveLap(best['lap'][0], best['lap'][1], name, args.output, info=runInfo)
+    writeMetrics(runInfo)
+    print(f'\nBest lap saved to {os.path.join(args.output, name)}.')
+
+if __name__ == "__main__":
+    freeze_support()
+    main()
@@ -0,0 +1,318 @@
+import math
+import os
+import shutil
+import subprocess
+import numpy as np
+from PIL import GifImagePlugin, Image, ImageDraw
+
+# Palette the frames are drawn with, every frame is a palette image so GIF frames need no quantizing
+WHITE, BLACK, BLUE, GREEN, RED = range(5)
+palette = np.array([
+    [255, 255, 255],
+    [0, 0, 0],
+    [31, 119, 180],
+    [0, 128, 0],
+    [214, 39, 40],
+], dtype=np.uint8)
+
+# Blank space around the track in nodes and the height of the title band in pixels
+margin = 3
+titleHeight = 24
+
+# Pixels per track node on small tracks and the longest side of the track in pixels, larger tracks are drawn at less than a pixel per node
+maxScale = 4
+framePixels = 1600
+
+def frameScale(xCoords, yCoords):
+    """
+    Picks the pixels per track node so the frame stays the same size however large the track is.
+
+    Parameters:
+    - xCoords (numpy.ndarray): X-coordinates of track nodes.
+    - yCoords (numpy.ndarray): Y-coordinates of track nodes.
+
+    Returns:
+    - float: Pixels per track node, at most maxScale and below 1 when the track has more than framePixels nodes across.
+    """
+
+    span = max(np.ptp(xCoords), np.ptp(yCoords)) + 2 * margin + 1
+    return min(maxScale, framePixels / span)
+
+def paletteImage(frame):
+    """
+    Wraps an array of palette indexes in a palette image.
+
+    Parameters:
+    - frame (numpy.ndarray): Array of palette indexes.
+
+    Returns:
+    - PIL.Image: Palette image of the frame.
+    """
+
+    image = Image.fromarray(np.ascontiguousarray(frame))
+    image.putpalette(palette.ravel().tolist())
+    return image
+
+def drawBackground(xCoords, yCoords, scale, title):
+    """
+    Rasterizes the static track background once.
+
+    Parameters:
+    - xCoords (numpy.ndarray): X-coordinates of track nodes.
+    - yCoords (numpy.ndarray): Y-coordinates of track nodes.
+    - scale (float): Pixels per track node, from frameScale.
+    - title (str): Title drawn above the track.
+
+    Returns:
+    - tuple: A tuple containing the palette index frame and a function mapping X and Y coordinates to pixel columns and rows.
+    """
+
+    xCoords = np.asarray(xCoords)
+    yCoords = np.asarray(yCoords)
+    minX = xCoords.min() - margin
+    maxY = yCoords.max() + margin
+    width = math.ceil((xCoords.max() - minX + margin + 1) * scale)
+    height = math.ceil((maxY - yCoords.min() + margin + 1) * scale) + titleHeight
+
+    # Video encoders need even dimensions
+    width += width % 2
+    height += height % 2
+
+    def toPixels(x, y):
+        columns = (np.asarray(x) - minX + 0.5) * scale
+        rows = (maxY - np.asarray(y) + 0.5) * scale + titleHeight
+        return columns, rows
+
+    frame = np.full((height, width), WHITE, dtype=np.uint8)
+
+    # Track nodes as dots like the plotted nodes, leaving gaps between them when there is room
+    # Below a pixel per node several nodes share a pixel, so the track is downsampled
+    dot = max(1, int(scale // 2))
+    columns, rows = (np.floor(pixels).astype(np.int64) for pixels in toPixels(xCoords, yCoords))
+    for offsetY in range(dot):
+        for offsetX in range(dot):
+            frame[rows - dot // 2 + offsetY, columns - dot // 2 + offsetX] = BLACK
+
+    if title:
+        image = paletteImage(frame)
+        draw = ImageDraw.Draw(image)
+        # Palette indexes can not be blended, so the text is drawn without anti-aliasing
+        draw.fontmode = '1'
+        draw.text((8, 6), title, fill=BLACK)
+        frame = np.asarray(image).copy()
+
+    return frame, toPixels
+
+def drawMarker(frame, column, row, radius, color):
+    """
+    Draws a diamond marker like the ones on the plot, only touching the pixels around it.
+
+    Parameters:
+    - frame (numpy.ndarray): Frame the marker is drawn on.
+    - column (int): Pixel column of the center of the marker.
+    - row (int): Pixel row of the center of the marker.
+    - radius (int): Radius of the marker in pixels.
+    - color (int): Palette index of the marker.
+
+    Returns:
+    - None
+    """
+
+    top = max(row - radius, 0)
+    left = max(column - radius, 0)
+    rows, columns = np.ogrid[top:min(row + radius + 1, frame.shape[0]), left:min(column + radius + 1, frame.shape[1])]
+    box = frame[top:top + rows.shape[0], left:left + columns.shape[1]]
+    box[np.abs(rows - row) + np.abs(columns - column) <= radius] = color
+
+def segmentPixels(columns, rows):
+    """
+    Samples every segment of a path at one point per pixel in a single vectorized pass.
+
+    Parameters:
+    - columns (numpy.ndarray): Pixel columns of the path nodes.
+    - rows (numpy.ndarray): Pixel rows of the path nodes.
+
+    Returns:
+    - tuple: A tuple containing the sampled pixel columns, rows and the index the samples of each segment end at.
+    """
+
+    stepColumns = np.diff(columns)
+    stepRows = np.diff(rows)
+    lengths = np.maximum(np.abs(stepColumns), np.abs(stepRows))
+    counts = lengths + 1
+    ends = np.cumsum(counts)
+
+    # Position of every sample within its own segment
+    segment = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(ends[-1]) - np.repeat(ends - counts, counts)
+    fraction = position / np.maximum(lengths, 1)[segment]
+
+    sampleColumns = np.rint(columns[:-1][segment] + fraction * stepColumns[segment]).astype(np.int64)
+    sampleRows = np.rint(rows[:-1][segment] + fraction * stepRows[segment]).astype(np.int64)
+    return sampleColumns, sampleRows, ends
+
+def renderFrames(xPath, yPath, xCoords, yCoords, title='', scale=None, frameStride=1):
+    """
+    Draws the path onto the track a few nodes at a time, only touching the pixels of the new segments.
+
+    Parameters:
+    - xPath (list): List of X-coordinates representing the path.
+    - yPath (list): List of Y-coordinates representing the path.
+    - xCoords (numpy.ndarray): X-coordinates of track nodes.
+    - yCoords (numpy.ndarray): Y-coordinates of track nodes.
+    - title (str): Title drawn above the track. Defaults to none.
+    - scale (float): Pixels per track node. Defaults to frameScale of the track.
+    - frameStride (int): Path nodes added per frame. Defaults to 1.
+
+    Yields:
+    - tuple: The frame buffer and the box (left, top, right, bottom) that changed since the previous frame.
+      The buffer is reused, so it has to be consumed before the next frame is requested.
+    """
+
+    if scale is None:
+        scale = frameScale(xCoords, yCoords)
+    frame, toPixels = drawBackground(xCoords, yCoords, scale, title)
+    height, width = frame.shape
+
+    # Smoothed laps fall between nodes, so their pixels are rounded down like the track nodes
+    columns, rows = (np.floor(pixels).astype(np.int64) for pixels in toPixels(xPath, yPath))
+    radius = max(3, round(scale))
+    drawMarker(frame, columns[0], rows[0], radius, GREEN)
+    drawMarker(frame, columns[-1], rows[-1], radius, RED)
+
+    yield frame, (0, 0, width, height)
+
+    if len(columns) < 2:
+        return
+
+    sampleColumns, sampleRows, ends = segmentPixels(columns, rows)
+    starts = np.concatenate(([0], ends[:-1]))
+    thickness = max(1, int(scale // 2))
+
+    for first in range(0, len(ends), frameStride):
+        last = min(first + frameStride, len(ends)) - 1
+        newColumns = sampleColumns[starts[first]:ends[last]]
+        newRows = sampleRows[starts[first]:ends[last]]
+
+        for offsetY in range(thickness):
+            for offsetX in range(thickness):
+                brushColumns = np.clip(newColumns - thickness // 2 + offsetX, 0, width - 1)
+                brushRows = np.clip(newRows - thickness // 2 + offsetY, 0, height - 1)
+                # Keep the start and finish markers on top of the path
+                keep = frame[brushRows, brushColumns] < GREEN
+                frame[brushRows[keep], brushColumns[keep]] = BLUE
+
+        left = max(newColumns.min() - thickness, 0)
+        top = max(newRows.min() - thickness, 0)
+        right = min(newColumns.max() + thickness + 1, width)
+        bottom = min(newRows.max() + thickness + 1, height)
+        yield frame, (left, top, right, bottom)
+
+def writeGif(frames, outputPath, frameCount, fps, holdSeconds, comment):
+    """
+    Streams frames into a GIF, each frame only storing the box that changed.
+
+    Parameters:
+    - frames (generator): Frames from renderFrames.
+    - outputPath (str): Path the GIF is written to.
+    - frameCount (int): Number of frames the generator yields.
+    - fps (int): Frames per second.
+    - holdSeconds (float): Seconds the finished path stays on screen before the animation loops.
+    - comment (str): Comment stored in the GIF.
+
+    Returns:
+    - None
+    """
+
+    frameDuration = 1000 / fps
+    with open(outputPath, 'wb') as gifFile:
+        for index, (frame, (left, top, right, bottom)) in enumerate(frames):
+            image = paletteImage(frame[top:bottom, left:right])
+
+            if index == 0:
+                header, _ = GifImagePlugin.getheader(image, info={'loop': 0, 'comment': comment})
+                gifFile.writelines(header)
+
+            duration = frameDuration + (holdSeconds * 1000 if index == frameCount - 1 else 0)
+            # Disposal 1 leaves every frame in place so the path builds up from the changed boxes alone
+            gifFile.writelines(GifImagePlugin.getdata(image, (left, top), duration=duration, disposal=1))
+        gifFile.write(b';')
+
+def writeVideo(frames, outputPath, fps, holdSeconds):
+    """
+    Streams frames into ffmpeg as raw RGB video.
+
+    Parameters:
+    - frames (generator): Frames from renderFrames.
+    - outputPath (str): Path the video is written to.
+    - fps (int): Frames per second.
+    - holdSeconds (float): Seconds the finished path stays on screen at the end.
+
+    Returns:
+    - None
+    """
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError('ffmpeg is needed to export video, install it or export a GIF instead.')
+
+    process = None
+    try:
+        for frame, _ in frames:
+            if process is None:
+                height, width = frame.shape
+                process = subprocess.Popen(
+                    [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+                     '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', outputPath],
+                    stdin=subprocess.PIPE,
+                )
+            rgbFrame = palette[frame].tobytes()
+            process.stdin.write(rgbFrame)
+
+        for _ in range(round(holdSeconds * fps)):
+            process.stdin.write(rgbFrame)
+    finally:
+        if process is not None:
+            process.stdin.close()
+            if process.wait() != 0:
+                raise RuntimeError(f'ffmpeg failed to write {outputPath}.')
+
+def exportAnimation(xPath, yPath, xCoords, yCoords, outputPath, numNodes=None, scale=None, fps=20, frameStride=1, duration=None, holdSeconds=2):
+    """
+    Exports an animation of the path being driven around the track as a GIF or video.
+
+    The track is rasterized once and every frame only draws the new path segments, so the cost grows
+    linearly with the length of the path. The first and last path nodes are marked as the start and finish.
+
+    Parameters:
+    - xPath (list): List of X-coordinates representing the path.
+    - yPath (list): List of Y-coordinates representing the path.
+    - xCoords (numpy.ndarray): X-coordinates of track nodes.
+    - yCoords (numpy.ndarray): Y-coordinates of track nodes.
+    - outputPath (str): Path the animation is written to, '.mp4', '.mov', '.mkv' or '.webm' write a video and anything else a GIF.
+    - numNodes (int): Number of nodes in the path shown in the title. Defaults to the length of the path.
+    - scale (float): Pixels per track node. Defaults to 4, or less so the track is at most framePixels across.
+    - fps (int): Frames per second. Defaults to 20.
+    - frameStride (int): Path nodes added per frame. Defaults to 1.
+    - duration (float): Target length of the animation in seconds, overrides frameStride when set.
+    - holdSeconds (float): Seconds the finished path stays on screen at the end. Defaults to 2.
+
+    Returns:
+    - int: Number of frames written.
+    """
+
+    if numNodes is None:
+        numNodes = len(xPath)
+    segments = max(len(xPath) - 1, 0)
+    if duration is not None:
+        frameStride = max(1, math.ceil(segments / max(duration * fps, 1)))
+    frameCount = 1 + math.ceil(segments / frameStride)
+
+    title = f'Number of nodes in path: {numNodes}'
+    frames = renderFrames(xPath, yPath, xCoords, yCoords, title, scale, frameStride)
+
+    if os.path.splitext(outputPath)[1].lower() in ('.mp4', '.mov', '.mkv', '.webm'):
+        writeVideo(frames, outputPath, fps, holdSeconds)
+    else:
+        writeGif(frames, outputPath, frameCount, fps, holdSeconds, title)
+    return frameCount
@@ -0,0 +1,256 @@
+import numpy as np
+from scipy import sparse
+from scipy.interpolate import splev, splprep
+from scipy.sparse.linalg import splu
+
+def resampleLoop(xPath, yPath, spacing):
+    """
+    Resamples a closed loop at points evenly spaced along its length, starting at its first point.
+
+    Parameters:
+    - xPath (numpy.ndarray): X-coordinates of the loop, the last point connects back to the first.
+    - yPath (numpy.ndarray): Y-coordinates of the loop.
+    - spacing (float): Distance between the resampled points in track nodes.
+
+    Returns:
+    - tuple: A tuple containing the X and Y coordinates of the resampled loop.
+    """
+
+    closedX = np.append(xPath, xPath[0])
+    closedY = np.append(yPath, yPath[0])
+    arcLength = np.concatenate(([0], np.cumsum(np.hypot(np.diff(closedX), np.diff(closedY)))))
+
+    count = max(int(round(arcLength[-1] / spacing)), 4)
+    samples = np.arange(count) * (arcLength[-1] / count)
+    return np.interp(samples, arcLength, closedX), np.interp(samples, arcLength, closedY)
+
+def smoothLoop(xPath, yPath, window):
+    """
+    Smooths a closed loop with a moving average that wraps around from the end of the loop to its start.
+
+    Parameters:
+    - xPath (numpy.ndarray): X-coordinates of the loop.
+    - yPath (numpy.ndarray): Y-coordinates of the loop.
+    - window (int): Number of points averaged, rounded up to an odd number.
+
+    Returns:
+    - tuple: A tuple containing the X and Y coordinates of the smoothed loop.
+    """
+
+    pad = min(window // 2, len(xPath) - 1)
+    kernel = np.full(2 * pad + 1, 1 / (2 * pad + 1))
+    smooth = lambda values: np.convolve(np.concatenate((values[-pad:] if pad else values[:0], values, values[:pad])), kernel, 'valid')
+    return smooth(np.asarray(xPath, dtype=np.float64)), smooth(np.asarray(yPath, dtype=np.float64))
+
+def smoothLap(xPath, yPath, spacing=3.0, smoothing=0.5, samples=8):
+    """
+    Fits a periodic smoothing spline through a closed lap and resamples it at points evenly spaced along its length.
+
+    The spline is evaluated densely once to measure its length, and the parameters of the evenly spaced points are
+    interpolated from that in one pass, so no point is placed by a search. The resampled lap has one point every
+    few nodes instead of one per node, and its length is measured along the smooth curve instead of along the
+    8-direction steps of the grid.
+
+    Parameters:
+    - xPath (list): List of X-coordinates of the lap, the last node connects back to the first.
+    - yPath (list): List of Y-coordinates of the lap.
+    - spacing (float): Distance between the resampled points in track nodes. Defaults to 3.
+    - smoothing (float): Typical distance in track nodes the spline may pass from a node of the lap. Defaults to 0.5.
+    - samples (int): Points the spline is evaluated at per node of the lap to measure its length. Defaults to 8.
+
+    Returns:
+    - tuple: A tuple containing the X and Y coordinates of the resampled lap as float arrays, starting at the first node, and the length of the lap.
+    """
+
+    xPath = np.asarray(xPath, dtype=np.float64)
+    yPath = np.asarray(yPath, dtype=np.float64)
+
+    # Parameterize by the distance along the lap, repeated nodes would give the spline a zero length step
+    steps = np.hypot(np.diff(xPath, append=xPath[0]), np.diff(yPath, append=yPath[0]))
+    keep = steps > 0
+    xPath, yPath, steps = xPath[keep], yPath[keep], steps[keep]
+    if len(xPath) < 4:
+        closedX, closedY = np.append(xPath, xPath[:1]), np.append(yPath, yPath[:1])
+        return xPath, yPath, float(np.hypot(np.diff(closedX), np.diff(closedY)).sum())
+    distance = np.concatenate(([0], np.cumsum(steps)))
+
+    # The periodic fit ignores the repeated first node at the end, it only marks where the period ends
+    spline, _ = splprep([np.append(xPath, xPath[0]), np.append(yPath, yPath[0])], u=distance, per=1, s=len(xPath) * smoothing ** 2)
+
+    dense = np.linspace(0, distance[-1], len(xPath) * samples + 1)
+    denseX, denseY = splev(dense, spline)
+    arcLength = np.concatenate(([0], np.cumsum(np.hypot(np.diff(denseX), np.diff(denseY)))))
+
+    count = max(int(round(arcLength[-1] / spacing)), 4)
+    targets = np.arange(count) * (arcLength[-1] / count)
+    smoothX, smoothY = splev(np.interp(targets, arcLength, dense), spline)
+    return smoothX, smoothY, float(arcLength[-1])
+
+def loopNormals(xPath, yPath):
+    """
+    Finds the unit normal pointing to the left of the direction of travel at every point of a closed loop.
+
+    Parameters:
+    - xPath (numpy.ndarray): X-coordinates of the loop.
+    - yPath (numpy.ndarray): Y-coordinates of the loop.
+
+    Returns:
+    - tuple: A tuple containing the X and Y components of the normals.
+    """
+
+    tangentX = np.roll(xPath, -1) - np.roll(xPath, 1)
+    tangentY = np.roll(yPath, -1) - np.roll(yPath, 1)
+    length = np.maximum(np.hypot(tangentX, tangentY), 1e-12)
+    return -tangentY / length, tangentX / length
+
+def trackCorridor(xPath, yPath, normalX, normalY, trackGrid, maxWidth, margin=0.25, step=0.5):
+    """
+    Measures how far the track reaches to each side of every point of a loop along its normal.
+
+    Every point is sampled along its normal in one array lookup. The corridor of a point is the unbroken run of track
+    around the track sample closest to it, so a neighboring stretch of track across a gap is never part of it.
+
+    Parameters:
+    - xPath (numpy.ndarray): X-coordinates of the loop.
+    - yPath (numpy.ndarray): Y-coordinates of the loop.
+    - normalX (numpy.ndarray): X components of the normals from loopNormals.
+    - normalY (numpy.ndarray): Y components of the normals from loopNormals.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - maxWidth (float): Farthest distance sampled to each side in track nodes.
+    - margin (float): Distance kept from the edge of the track in track nodes. Defaults to 0.25.
+    - step (float): Distance between samples in track nodes. Defaults to 0.5.
+
+    Returns:
+    - tuple: A tuple containing the lowest and highest offsets along the normal that stay on the track.
+    """
+
+    offsets = np.arange(-maxWidth, maxWidth + step / 2, step)
+    columns = np.clip(np.rint(xPath[:, None] + normalX[:, None] * offsets), 0, trackGrid.shape[0] - 1).astype(np.intp)
+    rows = np.clip(np.rint(yPath[:, None] + normalY[:, None] * offsets), 0, trackGrid.shape[1] - 1).astype(np.intp)
+    onTrack = trackGrid[columns, rows].astype(bool)
+
+    # The run of track around the sample closest to the point, bounded by the first gap on each side
+    index = np.arange(len(offsets))
+    anchor = np.where(onTrack, np.abs(offsets), np.inf).argmin(axis=1)
+    lastGapBelow = np.where(~onTrack & (index < anchor[:, None]), index, -1).max(axis=1)
+    firstGapAbove = np.where(~onTrack & (index > anchor[:, None]), index, len(offsets)).min(axis=1)
+
+    low = offsets[lastGapBelow + 1] + margin
+    high = offsets[firstGapAbove - 1] - margin
+
+    # Corridors narrower than the margins, and points with no track on their normal at all, are pinned to their anchor
+    pinned = (low > high) | ~onTrack.any(axis=1)
+    low[pinned] = high[pinned] = np.where(onTrack.any(axis=1), offsets[anchor], 0)[pinned]
+    return low, high
+
+def secondDifferences(count):
+    """
+    Builds the sparse matrix of second differences around a closed loop.
+
+    Parameters:
+    - count (int): Number of points on the loop.
+
+    Returns:
+    - scipy.sparse.csr_matrix: Matrix mapping point coordinates to their second differences.
+    """
+
+    rows = np.repeat(np.arange(count), 3)
+    columns = (rows + np.tile([-1, 0, 1], count)) % count
+    values = np.tile([1.0, -2.0, 1.0], count)
+    return sparse.csr_matrix((values, (rows, columns)), shape=(count, count))
+
+def boundedQuadratic(hessian, gradient, low, high, tolerance=1e-6, maxIterations=50):
+    """
+    Minimizes a convex quadratic with a bound on every variable by projected Newton steps.
+
+    Each step holds the variables that are at a bound and pushing against it, and solves for the rest with one sparse
+    factorization. The matrix is banded, so the factorization keeps the natural order of the points and costs time
+    linear in their number. Held variables take a plain gradient step, which lets them leave their bound again.
+
+    Parameters:
+    - hessian (scipy.sparse.csc_matrix): Positive definite matrix of the quadratic.
+    - gradient (numpy.ndarray): Linear term of the quadratic, 0.5 x'Hx + g'x is minimized.
+    - low (numpy.ndarray): Lowest value of every variable.
+    - high (numpy.ndarray): Highest value of every variable.
+    - tolerance (float): Largest move of the projected gradient step accepted as converged. Defaults to 1e-6.
+    - maxIterations (int): Most Newton steps taken. Defaults to 50.
+
+    Returns:
+    - numpy.ndarray: Minimizing value of every variable.
+    """
+
+    hessian = hessian.tocsc()
+    diagonal = hessian.diagonal()
+    objective = lambda values: 0.5 * values @ (hessian @ values) + gradient @ values
+    values = np.clip(np.zeros(len(gradient)), low, high)
+    for _ in range(maxIterations):
+        slope = hessian @ values + gradient
+        if np.abs(values - np.clip(values - slope, low, high)).max() <= tolerance:
+            break
+
+        held = ((values <= low) & (slope > 0)) | ((values >= high) & (slope < 0))
+        free = np.flatnonzero(~held)
+        step = -slope / diagonal
+        if len(free):
+            step[free] = splu(hessian[free][:, free].tocsc(), permc_spec='NATURAL').solve(-slope[free])
+
+        # Halve the step until the projected point lowers the objective enough
+        current = objective(values)
+        scale = 1.0
+        while True:
+            candidate = np.clip(values + scale * step, low, high)
+            if objective(candidate) <= current + 1e-4 * slope @ (candidate - values) or scale < 1e-8:
+                break
+            scale /= 2
+        if np.array_equal(candidate, values):
+            break
+        values = candidate
+    return values
+
+def minimumCurvatureLine(xPath, yPath, trackGrid, spacing=1.0, margin=0.25, iterations=2, window=9, clearance=None):
+    """
+    Finds a smooth raceline around the track that bends as little as possible, starting from a lap on the grid.
+
+    The lap is smoothed and resampled into a reference line. Every point of the raceline may then move along the
+    normal of the reference line, as far as the track reaches on each side. For evenly spaced points the curvature is
+    proportional to the second differences, so the sum of their squares is a quadratic in the offsets. It is minimized
+    as a sparse bound constrained quadratic program. Each further iteration uses the last raceline as the new
+    reference line, so the even spacing the objective assumes stays close to true.
+
+    Parameters:
+    - xPath (list): List of X-coordinates of the lap on the grid, the last node connects back to the first.
+    - yPath (list): List of Y-coordinates of the lap on the grid.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - spacing (float): Distance between the points of the raceline in track nodes. Defaults to 1.
+    - margin (float): Distance the raceline keeps from the edge of the track in track nodes. Defaults to 0.25.
+    - iterations (int): Number of times the problem is solved around the last raceline. Defaults to 2.
+    - window (int): Number of lap nodes averaged into each point of the first reference line. Defaults to 9.
+    - clearance (numpy.ndarray): Clearance grid of the track from trackClearance, bounds how wide the track can be. Defaults to estimating the width from the lap.
+
+    Returns:
+    - tuple: A tuple containing the X and Y coordinates of the raceline as float arrays, starting next to the first node of the lap.
+    """
+
+    lineX, lineY = smoothLoop(np.asarray(xPath), np.asarray(yPath), window)
+    lineX, lineY = resampleLoop(lineX, lineY, spacing)
+
+    # Sample wide enough to cross the track from one edge to the other, no part of the track is wider than twice its largest clearance
+    if clearance is not None:
+        maxWidth = 2 * float(clearance.max()) + 2
+    else:
+        lapLength = len(lineX) * spacing
+        maxWidth = 2 * np.count_nonzero(trackGrid) / lapLength + 2
+
+    for _ in range(iterations):
+        normalX, normalY = loopNormals(lineX, lineY)
+        low, high = trackCorridor(lineX, lineY, normalX, normalY, trackGrid, maxWidth, margin)
+
+        # Second differences of the moved points are linear in the offsets, D (line + offset * normal),
+        # so their squared sum is a quadratic with a banded matrix around the loop
+        differences = secondDifferences(len(lineX))
+        system = sparse.vstack([differences @ sparse.diags(normalX), differences @ sparse.diags(normalY)]).tocsr()
+        residual = np.concatenate((differences @ lineX, differences @ lineY))
+        offsets = boundedQuadratic((system.T @ system).tocsc(), system.T @ residual, low, high)
+        lineX, lineY = resampleLoop(lineX + offsets * normalX, lineY + offsets * normalY, spacing)
+
+    return lineX, lineY
@@ -0,0 +1,350 @@
+import random
+from array import array
+from collections import deque
+import numpy as np
+from headings import headingSteps, headingTurns, headingX, headingY, nextHeadings
+from runMetrics import count, metricsReport, profiled, record, resetMetrics
+from sharedTrack import attachTrackGrid
+from trackKernels import lapSearch
+
+def choosePath(moves, currPosX, currPosY, trackGrid, trackColumns, trackRows, startX, startY, visited):
+    nextMove = []
+    nextDist = 1e7 # Infinity
+    for move in moves:
+        nextX = currPosX + headingX[move]
+        nextY = currPosY + headingY[move]
+        coords = (nextX,nextY)
+        if trackColumns[nextX] and trackRows[nextY]:
+            if trackGrid[nextX, nextY] and coords not in visited:
+                xDist = abs(startX - nextX)
+                yDist = abs(startY - nextY)
+                dist = xDist + yDist
+                if dist < nextDist:
+                    nextDist = dist
+                    nextMove.append(coords)
+        else:
+            try:
+                nextMove.pop()
+            except IndexError:
+                nextMove = []
+    try:
+        return nextMove[-1]
+    except IndexError:
+        return None, None
+
+# Fewest steps from every node to the finish going around the track, a lower bound on how much longer a walk has to get
+# The start line is cut out like in the shortest lap search, so the lap has to come back over it in the start direction
+def buildFinishDistances(trackGrid, startX, startY, direction):
+    unreachable = trackGrid.size
+    finishDistances = np.full(trackGrid.size, unreachable, dtype=np.int64)
+    search = lapSearch(startX, startY, direction, trackGrid)
+    if search is None:
+        return finishDistances.reshape(trackGrid.shape)
+    traversable, height, stepOffsets, nextMoves, firstNode, lastNode = search
+    onTrack = trackGrid.astype(bool).tobytes()
+
+    finishDistances[startX * height + startY] = 0
+    distances = finishDistances.tolist()
+    # A walker heading in the start direction moves straight on or one turn either side, so it can reach the finish from any of three nodes
+    queue = deque()
+    for heading in nextMoves[direction]:
+        previousNode = startX * height + startY - stepOffsets[heading]
+        if distances[previousNode] == unreachable and onTrack[previousNode]:
+            distances[previousNode] = 1
+            if traversable[previousNode]:
+                queue.append(previousNode)
+    while queue:
+        node = queue.popleft()
+        for offset in stepOffsets:
+            nextNode = node + offset
+            if distances[nextNode] == unreachable and onTrack[nextNode]:
+                distances[nextNode] = distances[node] + 1
+                # Nodes on the line can be stepped on and back off, but not crossed
+                if traversable[nextNode]:
+                    queue.append(nextNode)
+    return np.array(distances, dtype=np.int64).reshape(trackGrid.shape)
+
+def findStart(startX, startY, direction, startDirX, startDirY, trackGrid, numberToBeatHigh, numberToBeatLow, bestNodes=None, finishDistances=None):
+    nodeCount = 1e7
+    path = None
+    pathCounter = 1
+    nodes = 0
+    pathsChecked = 0
+    steps = 0
+    backtracks = 0
+    aborted = 0
+    trackColumns = trackGrid.any(axis=1).tolist()
+    trackRows = trackGrid.any(axis=0).tolist()
+    trackX = np.flatnonzero(trackColumns)
+    trackY = np.flatnonzero(trackRows)
+    fullRangeX = trackX[-1] - trackX[0]
+    fullRangeY = trackY[-1] - trackY[0]
+    if finishDistances is None:
+        finishDistances = buildFinishDistances(trackGrid, startX, startY, direction).tolist()
+    while path == None or pathCounter < 1:
+        currPosX = startDirX
+        currPosY = startDirY
+        moves = nextHeadings[direction]
+        currPathX = array('i', [currPosX])
+        currPathY = array('i', [currPosY])
+        movesPath = bytearray()
+        # Extent of the path up to every node, popped along with the path so backing up shrinks it again
+        lowX, highX = array('i', [currPosX]), array('i', [currPosX])
+        lowY, highY = array('i', [currPosY]), array('i', [currPosY])
+        visited = {(currPosX,currPosY)}
+        try:
+            i = 0
+            nodes = 0
+            while (currPosX,currPosY) != (startX, startY):
+                steps += 1
+                # Pick up better laps other workers found
+                if bestNodes is not None and steps % 256 == 0:
+                    numberToBeatHigh = min(numberToBeatHigh, bestNodes.value)
+                # Drop the walk once it can not beat the best lap even if it used all of its backtracks,
+                # backing up to node k still leaves k nodes plus at least the distance from there to the finish
+                back = max(nodes - (100 - i), 0)
+                if back + finishDistances[currPathX[back]][currPathY[back]] >= numberToBeatHigh:
+                    raise Exception
+                moves = nextHeadings[moves[random.randint(0,2)]]
+                currPosX, currPosY = choosePath(moves, currPosX, currPosY, trackGrid, trackColumns, trackRows, startX, startY, visited)
+                if currPosX == None:
+                    if i == 100:
+                        raise Exception
+                    # Back up one node, the dead end stays visited
+                    if nodes:
+                        for stack in (currPathX, currPathY, movesPath, lowX, highX, lowY, highY):
+                            stack.pop()
+                        nodes -= 1
+                    currPosX = currPathX[-1]
+                    currPosY = currPathY[-1]
+                    moves = nextHeadings[movesPath[-1] if movesPath else direction]
+                    i += 1
+                    backtracks += 1
+                else:
+                    currPathX.append(currPosX)
+                    currPathY.append(currPosY)
+                    movesPath.append(moves[1])
+                    lowX.append(min(lowX[-1], currPosX))
+                    highX.append(max(highX[-1], currPosX))
+                    lowY.append(min(lowY[-1], currPosY))
+                    highY.append(max(highY[-1], currPosY))
+                    visited.add((currPosX, currPosY))
+                    nodes += 1
+
+                if (currPosX,currPosY) == (startX, startY) and (highX[-1] - lowX[-1]) / fullRangeX < 0.9 and (highY[-1] - lowY[-1]) / fullRangeY < 0.9:
+                    # Reset the path if range conditions are not met
+                    currPosX = startDirX
+                    currPosY = startDirY
+                    moves = nextHeadings[direction]
+                    currPathX = array('i', [currPosX])
+                    currPathY = array('i', [currPosY])
+                    movesPath = bytearray()
+                    lowX, highX = array('i', [currPosX]), array('i', [currPosX])
+                    lowY, highY = array('i', [currPosY]), array('i', [currPosY])
+                    visited = {(currPosX, currPosY)}
+                    nodes = 0
+            
+            if nodes <= nodeCount and nodes < numberToBeatHigh and nodes > numberToBeatLow and moves[1] == direction:
+                print('Path found.')
+                print(f'{nodes} Nodes.')
+                record('lapNodes', nodes)
+                # Let the other workers prune against this lap
+                if bestNodes is not None:
+                    with bestNodes.get_lock():
+                        if nodes < bestNodes.value:
+                            bestNodes.value = nodes
+                nodeCount = nodes
+                path = (currPathX.tolist(), currPathY.tolist())
+                pathCounter += 1
+                pathsChecked += 1
+        except Exception as e:
+            pathsChecked += 1
+            aborted += 1
+            if pathsChecked>500:
+                count('walksStarted', pathsChecked)
+                count('walksAborted', aborted)
+                count('backtracks', backtracks)
+                count('nodesExpanded', steps - backtracks)
+                return None,1e7
+    print(f'Checked {pathsChecked} paths.\n')
+
+    count('walksStarted', pathsChecked)
+    count('walksAborted', aborted)
+    count('backtracks', backtracks)
+    count('nodesExpanded', steps - backtracks)
+    return path, nodeCount
+
+# Memory the walkers of one batch may use for their visited stamps and path stacks
+walkerMemory = 128 * 1024 * 1024
+
+# Numbers the track nodes so walkers can move with table lookups instead of coordinates
+def buildWalkGraph(trackGrid, startX, startY, direction):
+    nodeX, nodeY = np.nonzero(trackGrid)
+    nodeIds = np.full(trackGrid.shape, -1, dtype=np.int32)
+    nodeIds[nodeX, nodeY] = np.arange(len(nodeX), dtype=np.int32)
+
+    # Neighbor of every node in every heading, -1 off the track, the grid border keeps the lookups in bounds
+    neighbors = nodeIds[nodeX[:, None] + headingSteps[:, 0], nodeY[:, None] + headingSteps[:, 1]]
+    distances = np.abs(nodeX - startX) + np.abs(nodeY - startY)
+    finishSteps = buildFinishDistances(trackGrid, startX, startY, direction)[nodeX, nodeY]
+    return nodeIds, neighbors, distances, finishSteps, nodeX, nodeY
+
+# Walks thousands of random laps in lockstep as arrays, the same walk as findStart but one step of every walker per loop
+def findStartBatch(startX, startY, direction, startDirX, startDirY, trackGrid, numberToBeatHigh, numberToBeatLow, bestNodes=None, seed=None, walkers=4096, maxWalks=10, walkGraph=None):
+    rng = np.random.default_rng(seed)
+    # A start or first step off the grid has no lap, the lookups below would index past its edge
+    width, height = trackGrid.shape
+    if not (0 <= startX < width and 0 <= startY < height and 0 <= startDirX < width and 0 <= startDirY < height):
+        return None, 1e7
+    nodeIds, neighbors, distances, finishSteps, nodeX, nodeY = walkGraph if walkGraph is not None else buildWalkGraph(trackGrid, startX, startY, direction)
+    firstNode = nodeIds[startDirX, startDirY]
+    finishNode = nodeIds[startX, startY]
+    if firstNode < 0 or finishNode < 0:
+        return None, 1e7
+    firstHeading = direction
+    fullRangeX = max(nodeX.max() - nodeX.min(), 1)
+    fullRangeY = max(nodeY.max() - nodeY.min(), 1)
+
+    # A walk is dropped once it is 100 backtracks past the best lap, so no path grows longer than this
+    bound = numberToBeatHigh
+    maxLength = int(min(len(nodeX), bound + 101)) + 2
+    walkers = int(max(1, min(walkers, walkerMemory // (len(nodeX) * 2 + maxLength * 5))))
+    rows = np.arange(walkers)
+
+    # Visited nodes are stamped with the walk number so starting a new walk never has to clear them
+    visited = np.zeros((walkers, len(nodeX)), dtype=np.uint16)
+    stamps = np.ones(walkers, dtype=np.uint16)
+    pathNodes = np.empty((walkers, maxLength), dtype=np.int32)
+    pathHeadings = np.empty((walkers, maxLength), dtype=np.int8)
+    position = np.empty(walkers, dtype=np.int32)
+    heading = np.empty(walkers, dtype=np.int64)
+    length = np.empty(walkers, dtype=np.int64)
+    backtracks = np.empty(walkers, dtype=np.int64)
+    lowX, highX, lowY, highY = (np.empty(walkers, dtype=np.int64) for _ in range(4))
+
+    def restart(mask):
+        stamps[mask] += 1
+        wrapped = mask & (stamps == np.iinfo(np.uint16).max)
+        if wrapped.any():
+            visited[wrapped] = 0
+            stamps[wrapped] = 1
+        position[mask] = firstNode
+        heading[mask] = firstHeading
+        length[mask] = 1
+        backtracks[mask] = 0
+        pathNodes[mask, 0] = firstNode
+        pathHeadings[mask, 0] = firstHeading
+        visited[mask, firstNode] = stamps[mask]
+        lowX[mask] = highX[mask] = nodeX[firstNode]
+        lowY[mask] = highY[mask] = nodeY[firstNode]
+
+    restart(np.ones(walkers, dtype=bool))
+
+    path = None
+    nodeCount = 1e7
+    walksChecked = 0
+    firstLapWalks = 0
+    steps = 0
+    walksStarted = walkers
+    aborted = 0
+    backedUp = 0
+    expanded = 0
+    # Once a lap is found the walkers finish about one more walk each to look for a shorter one
+    while walksChecked < maxWalks * walkers and (path is None or walksChecked - firstLapWalks < walkers):
+        steps += 1
+        # Pick up better laps other workers found
+        if bestNodes is not None and steps % 64 == 0:
+            bound = min(bound, bestNodes.value)
+
+        # Turn at random, then take the open move among the three around the new heading that is closest to the start
+        turned = headingTurns[heading, rng.integers(0, 3, walkers)]
+        candidates = neighbors[position[:, None], headingTurns[turned]]
+        available = (candidates >= 0) & (visited[rows[:, None], np.maximum(candidates, 0)] != stamps[:, None])
+        candidateDistances = np.where(available, distances[candidates], np.iinfo(np.int64).max)
+        moved = available.any(axis=1)
+        nextNode = candidates[rows, candidateDistances.argmin(axis=1)]
+
+        movedRows = rows[moved]
+        expanded += len(movedRows)
+        position[movedRows] = nextNode[movedRows]
+        heading[movedRows] = turned[movedRows]
+        pathNodes[movedRows, length[movedRows]] = nextNode[movedRows]
+        pathHeadings[movedRows, length[movedRows]] = turned[movedRows]
+        length[movedRows] += 1
+        visited[movedRows, nextNode[movedRows]] = stamps[movedRows]
+        lowX[movedRows] = np.minimum(lowX[movedRows], nodeX[nextNode[movedRows]])
+        highX[movedRows] = np.maximum(highX[movedRows], nodeX[nextNode[movedRows]])
+        lowY[movedRows] = np.minimum(lowY[movedRows], nodeY[nextNode[movedRows]])
+        highY[movedRows] = np.maximum(highY[movedRows], nodeY[nextNode[movedRows]])
+
+        # Stuck walkers back up one node, the dead end stays visited
+        stuckRows = rows[~moved]
+        backedUp += len(stuckRows)
+        backtracks[stuckRows] += 1
+        length[stuckRows] = np.maximum(length[stuckRows] - 1, 1)
+        position[stuckRows] = pathNodes[stuckRows, length[stuckRows] - 1]
+        heading[stuckRows] = pathHeadings[stuckRows, length[stuckRows] - 1]
+
+        # Drop walks that can not beat the best lap even if they used all of their backtracks,
+        # backing up to node k still leaves k nodes plus at least the distance from there to the finish
+        nodes = length - 1
+        back = np.maximum(nodes - np.maximum(100 - backtracks, 0), 0)
+        failed = (backtracks > 100) | (back + finishSteps[pathNodes[rows, back]] >= bound) | (nodes >= maxLength - 2)
+
+        finished = moved & (position == finishNode)
+        # Laps that came straight back without going around the track are started again
+        wideEnough = ((highX - lowX) / fullRangeX >= 0.9) | ((highY - lowY) / fullRangeY >= 0.9)
+        retry = finished & ~wideEnough
+        finished &= wideEnough
+        laps = finished & (nodes < bound) & (nodes > numberToBeatLow) & (heading == firstHeading)
+
+        if laps.any():
+            best = rows[laps][nodes[laps].argmin()]
+            nodeCount = int(nodes[best])
+            bound = nodeCount
+            lapNodes = pathNodes[best, :length[best]]
+            if path is None:
+                firstLapWalks = walksChecked
+            path = (nodeX[lapNodes].tolist(), nodeY[lapNodes].tolist())
+            record('lapNodes', nodeCount)
+            # Let the other workers prune against this lap
+            if bestNodes is not None:
+                with bestNodes.get_lock():
+                    if nodeCount < bestNodes.value:
+                        bestNodes.value = nodeCount
+
+        # Walks that came straight back count against maxWalks too, or a track where most walks do so would never stop
+        done = failed | finished | retry
+        walksChecked += int(done.sum())
+        aborted += int((failed & ~finished).sum())
+        if done.any():
+            walksStarted += int(done.sum())
+            restart(done)
+
+    if path is not None:
+        print('Path found.')
+        print(f'{nodeCount} Nodes.')
+    print(f'Checked {walksChecked} paths with {walkers} walkers.\n')
+
+    count('walksStarted', walksStarted)
+    count('walksAborted', aborted)
+    count('backtracks', backedUp)
+    count('nodesExpanded', expanded)
+    return path, nodeCount
+
+# State each worker of the persistent pool is started with
+workerState = {}
+
+def initWorker(gridHandle, bestNodes):
+    workerState['trackGrid'] = attachTrackGrid(gridHandle)
+    workerState['bestNodes'] = bestNodes
+
+# Worker entry point that runs findStartBatch, the walk graph is kept for the next iterations from the same start
+def findStartBatchShared(startX, startY, direction, startDirX, startDirY, numberToBeatHigh, numberToBeatLow, seed):
+    resetMetrics()
+    if workerState.get('walkStart') != (startX, startY, direction):
+        workerState['walkGraph'] = buildWalkGraph(workerState['trackGrid'], startX, startY, direction)
+        workerState['walkStart'] = (startX, startY, direction)
+    with profiled('search-random-batch'):
+        path, nodeCount = findStartBatch(startX, startY, direction, startDirX, startDirY, workerState['trackGrid'], numberToBeatHigh, numberToBeatLow, workerState['bestNodes'], seed, walkGraph=workerState['walkGraph'])
+    return path, nodeCount, metricsReport()
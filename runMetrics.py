@@ -0,0 +1,212 @@
+import cProfile
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Set RACELINE_METRICS to a file to append the metrics of every run to it as one JSON line
+metricsFile = os.environ.get('RACELINE_METRICS')
+
+# Set RACELINE_PROFILE to a folder to profile the hot loops into it, with cProfile or, when RACELINE_PROFILER is 'sample',
+# by sampling the stack every few milliseconds so the loops run at close to full speed
+profileFolder = os.environ.get('RACELINE_PROFILE')
+profiler = os.environ.get('RACELINE_PROFILER', 'cprofile')
+sampleInterval = 0.005
+
+# Metrics of the run in progress in this process
+currentRun = {}
+profileRuns = itertools.count()
+activeProfiles = []
+
+def resetMetrics():
+    """
+    Starts a new run, dropping every stage time, counter and timeline recorded so far in this process.
+
+    Returns:
+    - None
+    """
+
+    currentRun.clear()
+    currentRun.update(startTime=time.time(), stages={}, counters={}, timelines={})
+
+resetMetrics()
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of the run, the time of every pass through the same stage is added up.
+
+    Parameters:
+    - name (str): Name of the stage, such as 'decode', 'search' or 'render'.
+
+    Yields:
+    - None
+    """
+
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = currentRun['stages']
+        stages[name] = stages.get(name, 0) + time.perf_counter() - startTime
+
+def count(name, amount=1):
+    """
+    Adds to a counter of the run. Hot loops keep their own local count and add it once when they finish.
+
+    Parameters:
+    - name (str): Name of the counter, such as 'nodesExpanded' or 'backtracks'.
+    - amount (int): Amount to add. Defaults to 1.
+
+    Returns:
+    - None
+    """
+
+    counters = currentRun['counters']
+    counters[name] = counters.get(name, 0) + amount
+
+def record(name, value):
+    """
+    Records a value of the run with the time it was seen at, such as the best lap found so far.
+
+    Parameters:
+    - name (str): Name of the timeline.
+    - value (float): Value to record.
+
+    Returns:
+    - None
+    """
+
+    currentRun['timelines'].setdefault(name, []).append((time.time(), value))
+
+def metricsReport():
+    """
+    Gets the metrics of the run in progress as plain data that can be written as JSON or sent back from a worker.
+
+    Returns:
+    - dict: Start time of the run, seconds spent in each stage, the counters and each timeline as [seconds into the run, value] pairs.
+    """
+
+    startTime = currentRun['startTime']
+    return {
+        'startTime': round(startTime, 4),
+        'totalTime': round(time.time() - startTime, 4),
+        'stages': {name: round(seconds, 4) for name, seconds in currentRun['stages'].items()},
+        'counters': dict(currentRun['counters']),
+        'timelines': {name: [[round(seenTime - startTime, 4), value] for seenTime, value in points] for name, points in currentRun['timelines'].items()},
+    }
+
+def mergeMetrics(report):
+    """
+    Adds the metrics a worker process reported with metricsReport to the run in progress.
+
+    Parameters:
+    - report (dict): Report from metricsReport.
+
+    Returns:
+    - None
+    """
+
+    for name, seconds in report['stages'].items():
+        currentRun['stages'][name] = currentRun['stages'].get(name, 0) + seconds
+    for name, amount in report['counters'].items():
+        count(name, amount)
+    for name, points in report['timelines'].items():
+        timeline = currentRun['timelines'].setdefault(name, [])
+        timeline.extend((report['startTime'] + offset, value) for offset, value in points)
+        timeline.sort(key=lambda point: point[0])
+
+def writeMetrics(info, path=None, report=None):
+    """
+    Appends the metrics of a run to a metrics file as one JSON line, next to the details of the run.
+
+    Parameters:
+    - info (dict): Details of the run, such as the track, size and search mode.
+    - path (str): File to append to. Defaults to metricsFile, nothing is written if neither is set.
+    - report (dict): Metrics to write, such as a report a worker sent back. Defaults to the metrics of the run in progress.
+
+    Returns:
+    - str or None: Path of the file appended to, or None if nothing was written.
+    """
+
+    path = path or metricsFile
+    if not path:
+        return None
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'a') as metricsLog:
+        metricsLog.write(json.dumps(dict(info, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), metrics=report or metricsReport()), default=str) + '\n')
+    return path
+
+def sampleStacks(threadId, samples, stop):
+    """
+    Samples the stack of a thread until told to stop, counting how often each stack is seen.
+
+    Parameters:
+    - threadId (int): Identifier of the thread to sample.
+    - samples (dict): Counts of each stack, keyed by its frames from the outermost in, to add to.
+    - stop (threading.Event): Event that ends the sampling.
+
+    Returns:
+    - None
+    """
+
+    while not stop.wait(sampleInterval):
+        frame = sys._current_frames().get(threadId)
+        stack = []
+        while frame is not None:
+            stack.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        samples[key] = samples.get(key, 0) + 1
+
+@contextmanager
+def profiled(name):
+    """
+    Profiles a hot loop when RACELINE_PROFILE is set and does nothing otherwise.
+
+    cProfile writes a '.prof' file for pstats or snakeviz, sampling writes a '.folded' file of stack counts for flame graph tools.
+    Profiles do not nest, a loop inside one already being profiled is left to the outer profile.
+
+    Parameters:
+    - name (str): Name of the loop, used in the filename.
+
+    Yields:
+    - None
+    """
+
+    if not profileFolder or activeProfiles:
+        yield
+        return
+
+    os.makedirs(profileFolder, exist_ok=True)
+    path = os.path.join(profileFolder, f'{name}_{os.getpid()}_{next(profileRuns)}')
+    activeProfiles.append(name)
+    try:
+        if profiler == 'sample':
+            samples = {}
+            stop = threading.Event()
+            sampler = threading.Thread(target=sampleStacks, args=(threading.get_ident(), samples, stop), daemon=True)
+            sampler.start()
+            try:
+                yield
+            finally:
+                stop.set()
+                sampler.join()
+                with open(f'{path}.folded', 'w') as foldedFile:
+                    foldedFile.writelines(f'{stack} {samplesSeen}\n' for stack, samplesSeen in samples.items())
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                profile.dump_stats(f'{path}.prof')
+    finally:
+        activeProfiles.pop()
@@ -0,0 +1,39 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+def shareTrackGrid(trackGrid):
+    """
+    Copies the track grid into shared memory so worker processes can attach to it instead of having it pickled to them.
+    The caller closes and unlinks the shared memory once the workers are done with it.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - tuple: The shared memory block and the handle workers pass to attachTrackGrid, its name, shape and dtype.
+    """
+
+    sharedGrid = shared_memory.SharedMemory(create=True, size=max(trackGrid.nbytes, 1))
+    np.ndarray(trackGrid.shape, dtype=trackGrid.dtype, buffer=sharedGrid.buf)[:] = trackGrid
+    return sharedGrid, (sharedGrid.name, trackGrid.shape, trackGrid.dtype.str)
+
+# Shared track grids this process has attached to, kept open so later tasks reuse them
+attachedGrids = {}
+
+def attachTrackGrid(gridHandle):
+    """
+    Attaches to a track grid put in shared memory by shareTrackGrid. Each grid is only attached once per process
+    and kept open, so later tasks in a worker reuse it.
+
+    Parameters:
+    - gridHandle (tuple): Name, shape and dtype of the shared grid from shareTrackGrid.
+
+    Returns:
+    - numpy.ndarray: The track grid backed by the shared memory, without a copy.
+    """
+
+    name, shape, dtype = gridHandle
+    if name not in attachedGrids:
+        sharedGrid = shared_memory.SharedMemory(name=name)
+        attachedGrids[name] = (sharedGrid, np.ndarray(shape, dtype=dtype, buffer=sharedGrid.buf))
+    return attachedGrids[name][1]
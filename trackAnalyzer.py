@@ -1,81 +1,39 @@
-from PIL import Image
-import matplotlib.pyplot as plt
-from matplotlib.animation import PillowWriter
-# from scipy.interpolate import make_interp_spline, BSpline
 import numpy as np
 import os
 import time
-from multiprocessing import Pool, freeze_support
-
-def is_black(pixel, threshold=150):
-    """
-    Determines whether a given pixel is considered black based on its luminance.
-
-    Parameters:
-    - pixel (int or tuple): Pixel value as a single intensity value or a tuple (R, G, B).
-    - threshold (int): Luminance threshold to classify a pixel as black. Defaults to 100.
-
-    Returns:
-    - bool: True if the pixel is black, False otherwise.
-    """
-
-    # Calculate luminance as a measure of intensity (brightness)
-    if type(pixel) == int:
-        luminance = 0
-    else:
-        luminance = 0.299 * pixel[0] + 0.587 * pixel[1] + 0.114 * pixel[2]
-    # Check if luminance is below the threshold
-    return luminance <= threshold
-
-def processImageSection(args):
-    """
-    Processes a section of an image to extract track nodes.
-
-    Parameters:
-    - args (tuple): A tuple containing image_section, size, and offset.
-    - image_section: Image section to process.
-    - size: Size of the image section (width, height).
-    - offset: Offset coordinates.
-
-    Returns:
-    - tuple: A tuple containing lists of X and Y coordinates of track nodes and the total count of nodes.
-    """
-
-    image_section, size, offset = args
-    width, height = size
-
-    i = 0
-    xCoords = []
-    yCoords = []
-    for y in range(height):
-        for x in range(width):
-            pixel = image_section.getpixel((x, y))
-            if is_black(pixel):
-                i += 1
-                xCoords.append(x + offset[0])
-                yCoords.append(-y + height + offset[1])
-
-    return xCoords, yCoords, i
-
-def plotNodes(xCoords, yCoords, trackNodes):
+from multiprocessing import freeze_support
+from headings import moveCodes, parseHeading
+from lapOutput import finishFigure, isHeadless, outputFolder, pyplot, renderFormats, runName, saveFigure, saveLap
+from runMetrics import metricsReport, resetMetrics, stage, writeMetrics
+from trackKernels import directions, findLap, moveOffset
+from trackSession import TrackSession
+
+def plotNodes(xCoords, yCoords, trackNodes, name=None, folder=outputFolder):
     """
     Plots the track nodes on a graph.
 
     Parameters:
-    - xCoords (list): List of X-coordinates of track nodes.
-    - yCoords (list): List of Y-coordinates of track nodes.
+    - xCoords (numpy.ndarray): X-coordinates of track nodes.
+    - yCoords (numpy.ndarray): Y-coordinates of track nodes.
     - trackNodes (int): Number of track nodes.
+    - name (str): Filename to save the plot to as a PNG, without an extension. Not saved if None.
+    - folder (str): Folder the plot is saved to. Defaults to outputFolder.
 
     Returns:
-    - None
+    - list: Paths of the files written.
     """
 
+    plt = pyplot()
+    fig = plt.figure()
     plt.plot(xCoords, yCoords, '.', label='Track Nodes', color='black')
     plt.xlabel('X-axis')
     plt.ylabel('Y-axis')
     plt.title(f'Number of nodes in track: {trackNodes}')
     plt.legend()
-    plt.show()
+
+    paths = [] if name is None else saveFigure(fig, name, folder, ('png',))
+    finishFigure(fig)
+    return paths
 
 def printTracks(tracksFolder):
     """
@@ -118,301 +76,142 @@ def printTracks(tracksFolder):
     print(f"You selected: {chosenTrack.split('.')[0].capitalize()}")
     return chosenTrack
 
-# Dictionary of moves each with a specific direction
-getMove = {
-    '0111':['0011','0111','0100'],
-    '0100':['0111','0100','0101'],
-    '0101':['0100','0101','0001'],
-    '0011':['1111','0011','0111'],
-    '0001':['0101','0001','1101'],
-    '1111':['0011','1111','1100'],
-    '1100':['1111','1100','1101'],
-    '1101':['1100','1101','0001']
-}
-
-# Dictionary of opposite directions
-getOpposite = {
-    '0111':'1101',
-    '0100':'1100',
-    '0101':'1111',
-    '0011':'0001',
-    '0001':'0011',
-    '1111':'0101',
-    '1100':'0100',
-    '1101':'0111'
-}
-
-def choosePath(moves, currPosX, currPosY, xCoords, yCoords, startX, startY, visited):
-    """
-    This function determines the next valid move based on a set of possible moves, current position, and visited nodes.
-
-    Parameters:
-    - moves (list): List of possible moves represented as strings.
-    - currPosX (int): Current X-coordinate.
-    - currPosY (int): Current Y-coordinate.
-    - xCoords (list): List of valid X-coordinates for the track.
-    - yCoords (list): List of valid Y-coordinates for the track.
-    - startX (int): Starting X-coordinate.
-    - startY (int): Starting Y-coordinate.
-    - visited (list): List of visited coordinates.
-
-    Returns:
-    - tuple: A tuple containing the next coordinates to move to and the corresponding move string.
-      Example: ((nextX, nextY), nextMoveStr)
-    """
-        
-    nextMove = []
-    nextDist = 1e7 # Infinity
-    nextMoveStr = moves[0]
-    for move in moves:
-        # Extract the move based on the string
-        iNeg = int(move[0])
-        jNeg = int(move[2])
-        i = int(move[1])
-        j = int(move[3])
-        if iNeg:
-            i *= -1
-        if jNeg:
-            j *= -1
-        nextX = currPosX + j
-        nextY = currPosY + i
-        coords = (nextX,nextY)
-        # If the coordinates are in bounds of the track
-        if nextX in xCoords and nextY in yCoords:
-            xIndex = [i for i, x in enumerate(xCoords) if x == nextX]
-            yIndex = [i for i, y in enumerate(yCoords) if y == nextY]
-            # If the coordinates have not been visited
-            if any(index in yIndex for index in xIndex) and coords not in visited:
-                xDist = abs(startX - nextX)
-                yDist = abs(startY - nextY)
-                dist = xDist + yDist
-                # If move is local minimum set to next move
-                if dist < nextDist:
-                    nextDist = dist
-                    nextMove.append(coords)
-                    nextMoveStr = move
-        else:
-            try:
-                nextMove.pop()
-            except IndexError:
-                nextMove = []
-    try:
-        return (nextMove[-1], nextMoveStr)
-    except IndexError:
-        return ((None, None), nextMoveStr)
-
-def findStart(startX, startY, direction, startDirX, startDirY, xCoords, yCoords):
+def start(x,y,direction, xCoords, yCoords, trackGrid, mode='greedy', name=None, info=None, clearance=None, minClearance=0, searchCache=None):
     """
-    This function explores paths from a given starting point in a specified direction and finds the optimal path.
-
-    Parameters:
-    - startX (int): Starting X-coordinate.
-    - startY (int): Starting Y-coordinate.
-    - direction (str): Initial direction of movement.
-    - startDirX (int): Initial X-coordinate for direction.
-    - startDirY (int): Initial Y-coordinate for direction.
-    - xCoords (list): List of valid X-coordinates for the track.
-    - yCoords (list): List of valid Y-coordinates for the track.
-    - concurrentProcesses (bool): Flag indicating whether to use concurrent processes.
-
-    Returns:
-    - tuple or None: A tuple containing two lists of X and Y coordinates representing the optimal path, or None if no path is found.
-    """
-
-    nodeCount = 1e7
-    path = None
-    pathCounter = 1
-    failed = 0
-    countNeeded = 6
-    while path == None or pathCounter < countNeeded:
-        currPosX = startDirX
-        currPosY = startDirY
-        move = direction
-        currPathX = [currPosX]
-        currPathY = [currPosY]
-        movesPath = []
-        visited = [(currPosX,currPosY)]
-        runningX = []
-        runningY = []
-        nodes = 0
-        try:
-            # Keeps checking if the position is back at the start
-            while (currPosX,currPosY) != (startX, startY):
-                if failed == 1000:
-                    return (runningX, runningY)
-                moves = getMove[move]
-                coords, move = choosePath(moves, currPosX, currPosY, xCoords, yCoords, startX, startY, visited)
-                currPosX, currPosY = coords
-                # If no current position, backtrack
-                if currPosX == None:
-                    # To prevent from infinite loop, if it fails 1000 times it breaks out returning the latest path
-                    if failed == 1000:
-                        raise Exception
-                    currPosX = currPathX.pop()
-                    currPosY = currPathY.pop()
-                    moves = movesPath.pop()
-                    move = moves[1]
-                    visited.pop()
-                    failed += 1
-                    nodes -= 1
-                else:
-                    currPathX.append(currPosX)
-                    currPathY.append(currPosY)
-                    runningX.append(currPosX)
-                    runningY.append(currPosY)
-                    movesPath.append(moves)
-                    visited.append((currPosX, currPosY))
-                    nodes += 1
-            
-            if nodes <= nodeCount and moves[1] == direction:
-                nodeCount = nodes
-                path = (currPathX, currPathY)
-                pathCounter += 1
-
-        except Exception as e:
-            failed += 1
-            path = (currPathX, currPathY)
-
-    return path
-
-def start(x,y,direction, xCoords, yCoords):
-    """
-    This function initiates the pathfinding process, exploring paths in two directions and combining the results for an optimal path.
+    This function initiates the pathfinding process with findLap, smooths the resulting lap into a raceline, saves both and shows them.
+    The details of the run are saved with the lap along with its metrics, the stage times and search counters since the last resetMetrics.
 
     Parameters:
     - x (int): X-coordinate of the starting point.
     - y (int): Y-coordinate of the starting point.
-    - direction (str): Initial direction of movement.
-    - xCoords (list): List of valid X-coordinates for the track.
-    - yCoords (list): List of valid Y-coordinates for the track.
+    - direction (str or int): Initial direction of movement, as a move string from the directions menu or a heading ID.
+    - xCoords (numpy.ndarray): Valid X-coordinates for the track.
+    - yCoords (numpy.ndarray): Valid Y-coordinates for the track.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - mode (str): Search mode, either 'greedy', 'optimal', 'skeleton', 'multiresolution' or 'bidirectional'. Defaults to 'greedy'.
+    - name (str): Filename the lap and its renders are saved under. Defaults to a new run name.
+    - info (dict): Details of the run, such as the track and size, saved with the lap. Defaults to none.
+    - clearance (numpy.ndarray): Clearance grid of the track from trackClearance. Defaults to none.
+    - minClearance (float): Distance in track nodes the lap and raceline keep from the edge of the track. Defaults to no limit.
+    - searchCache (dict): Grids and graphs earlier searches on the same track built, from a TrackSession. Defaults to none.
 
     Returns:
     - None
     """
 
-    iNeg = int(direction[0])
-    jNeg = int(direction[2])
-    i = int(direction[1])
-    j = int(direction[3])
-    if iNeg:
-        i *= -1
-    if jNeg:
-        j *= -1
+    # The raceline stage needs SciPy, which is only imported once a run gets that far
+    from raceline import minimumCurvatureLine, smoothLap
+
+    # Searches only work with heading IDs, move strings stop here
+    direction = parseHeading(direction)
+    j, i = moveOffset(direction)
+
+    if name is None:
+        name = runName(mode)
 
     startTime = time.time()
 
-    print('\nSearching direction 1...')
-    resultsDir1 = findStart(x,y,direction,x+j,y+i,xCoords,yCoords) # Goes the wanted direction
-
-    print('Searching direction 2...')
-    resultsDir2 = findStart(x+j,y+i,getOpposite[direction],x,y,xCoords,yCoords) # Goes the opposite direction
-
-    maxDist = -1e7
-    maxDistCoord = None
-    maxDistIndex = 0
-
-    # Get the max distance away 
-    for index in range(len(resultsDir2[0])):
-        coordX = resultsDir2[0][index]
-        coordY = resultsDir2[1][index]
-        xDist = abs(x - coordX)
-        yDist = abs(y - coordY)
-        dist = xDist + yDist
-        if dist > maxDist:
-            maxDist = dist
-            maxDistCoord = (coordX,coordY)
-            maxDistIndex = index
-
-    dir2Index = maxDistIndex
-
-    # Check distance for the other direction
-    dir1Index = 0
-    for dirIndex in range(len(resultsDir1[0])):
-        if resultsDir1[0][dirIndex] == maxDistCoord[0] and resultsDir1[1][dirIndex] == maxDistCoord[1]:
-            dir1Index = dirIndex
-            break
+    results = findLap(x,y,direction,trackGrid,mode,clearance,minClearance,searchCache)
 
-    if dir1Index == 0:
-        print('\nCannot find path.')
+    endTime = time.time()
 
-        endTime = time.time()
-        print(f'\nWait time was: {round(endTime-startTime,2)} seconds.')
-    else:
-        # Get the best parts of each direction
-        half1X = resultsDir2[0][dir2Index:-1]
-        half1Y = resultsDir2[1][dir2Index:-1]
-        half2X = resultsDir1[0][dir1Index:-1]
-        half2Y = resultsDir1[1][dir1Index:-1]
+    runInfo = dict(info or {}, startX=x, startY=y, direction=moveCodes[direction], mode=mode, minClearance=minClearance, searchTime=round(endTime-startTime, 4))
 
-        results = (half1X[::-1] + half2X,half1Y[::-1] + half2Y) # Stitches the better parts of each together
+    if results is None:
+        if mode != 'greedy':
+            print('\nNo closed lap exists from this start point and direction.')
+        else:
+            print('\nCannot find path.')
 
-        endTime = time.time()
+        print(f'\nWait time was: {round(endTime-startTime,2)} seconds.')
+        writeMetrics(runInfo)
+    else:
         print(f'\nWait time was: {round(endTime-startTime,2)} seconds.')
 
-        showPath(results[0], results[1], xCoords, yCoords, x+j, y+i, len(results[0]))
-
-def showPath(xPath, yPath, xCoords, yCoords, startX, startY, numNodes):
+        # The lap on the grid is the starting guess for the minimum curvature raceline
+        racelineStart = time.time()
+        with stage('raceline'):
+            # A node on the edge has a clearance of 1, so the margin from the edge is one less than the clearance
+            raceline = minimumCurvatureLine(results[0], results[1], trackGrid, margin=max(0.25, minClearance - 1), clearance=clearance)
+        racelineTime = time.time() - racelineStart
+        print(f'Raceline time was: {round(racelineTime,2)} seconds.')
+
+        # The smooth curve through the lap measures it here and is drawn by showPath, so it is only fitted once
+        smoothed = smoothLap(results[0], results[1])
+        lapLength = smoothed[2]
+        print(f'Lap length: {round(lapLength,1)} nodes.')
+
+        showPath(results[0], results[1], xCoords, yCoords, x+j, y+i, len(results[0]), name, raceline=raceline, smoothed=smoothed)
+
+        # Saved after rendering so the metrics written with the lap cover every stage of the run
+        runInfo.update(racelineTime=round(racelineTime, 4), lapLength=round(lapLength, 2), metrics=metricsReport())
+        saveLap(results[0], results[1], name, info=runInfo)
+        saveLap(raceline[0], raceline[1], f'{name}_raceline')
+        writeMetrics(runInfo)
+        print(f'\nLap saved to {os.path.join(outputFolder, name)}.')
+
+def showPath(xPath, yPath, xCoords, yCoords, startX, startY, numNodes, name='TrackVisualization', folder=outputFolder, renders=renderFormats, raceline=None, smoothed=None):
     """
-    This function displays the optimal path on a plot, along with track nodes and start/finish nodes.
+    This function renders the optimal path, along with track nodes and start/finish nodes, and displays it when there is a display.
 
     Parameters:
     - xPath (list): List of X-coordinates representing the optimal path.
     - yPath (list): List of Y-coordinates representing the optimal path.
-    - xCoords (list): List of valid X-coordinates for the track.
-    - yCoords (list): List of valid Y-coordinates for the track.
+    - xCoords (numpy.ndarray): Valid X-coordinates for the track.
+    - yCoords (numpy.ndarray): Valid Y-coordinates for the track.
     - startX (int): Starting X-coordinate.
     - startY (int): Starting Y-coordinate.
     - numNodes (int): Number of nodes in the path.
+    - name (str): Filename the renders are saved under, without an extension. Defaults to 'TrackVisualization'.
+    - folder (str): Folder the renders are saved to. Defaults to outputFolder.
+    - renders (tuple): Formats to render, 'gif' for the animation and 'png', 'svg' or 'pdf' for the plot. Defaults to renderFormats.
+    - raceline (tuple): X and Y coordinates of a smooth raceline drawn over the plot. Defaults to none.
+    - smoothed (tuple): X and Y coordinates and length of the lap from smoothLap, drawn instead of fitting the curve again. Defaults to fitting it here.
 
     Returns:
-    - None
+    - list: Paths of the files written.
     """
 
-    print('\nRendering path...')
-    
-    # Point to divide track into
-    splitPoint = 1
-
-    # Extract marked points
-    markedX = xPath[::splitPoint]
-    markedY = yPath[::splitPoint]
-
-    # Adding the very last point to the marked points
-    markedX.append(startX)
-    markedY.append(startY)
-
-    # Connect the marked points with lines
-    plt.plot(markedX, markedY, '-', color='b')
-
-    fig = plt.figure(figsize=(15, 12))
-    plt.plot(xCoords, yCoords, '.', label='Track Nodes', color='black')
-    l, = plt.plot([], [], '-', color='b')
-    plt.plot(markedX[0], markedY[0], 'D', label='Start Node', color='g')
-    plt.plot(startX, startY, 'D', label='Finish Node', color='r')
-    plt.xlabel('X-axis')
-    plt.ylabel('Y-axis')
-    plt.title(f'Number of nodes in path: {numNodes}', loc='center')
-
-    metadata = dict(title=f'Number of nodes in path: {numNodes}')
-    writer = PillowWriter(fps=20, metadata=metadata)
-
-    xData = []
-    yData = []
-
-    with writer.saving(fig, "TrackVisualization.gif", 120):
-        for i in range(len(markedX)):
-            xData.append(markedX[i])
-            yData.append(markedY[i])
-
-            l.set_data(xData, yData)
-
-            writer.grab_frame()
-        for _ in range(20):  # Add 20 duplicate frames (2 seconds pause)
-            writer.grab_frame()
-
-    plt.plot(markedX, markedY, '-', label='Car Path', color='b')
-    plt.legend()
-    plt.show()
+    # Rendering is imported on first use so processes that only search never load it
+    from pathAnimation import exportAnimation
+
+    plt = pyplot()
+    with stage('render'):
+        print('\nRendering path...')
+
+        # A smooth curve through the lap with a point every few nodes draws the same lap from far fewer points
+        if smoothed is None:
+            from raceline import smoothLap
+            smoothed = smoothLap(xPath, yPath)
+        markedX, markedY, _ = smoothed
+
+        # Adding the very last point to the marked points
+        markedX = np.append(markedX, markedX[0])
+        markedY = np.append(markedY, markedY[0])
+
+        paths = []
+        if 'gif' in renders:
+            # The animation is rasterized straight into GIF frames instead of redrawing the figure for every node
+            os.makedirs(folder, exist_ok=True)
+            paths.append(os.path.join(folder, f'{name}.gif'))
+            exportAnimation(markedX, markedY, xCoords, yCoords, paths[-1], numNodes)
+
+        fig = plt.figure(figsize=(15, 12))
+        plt.plot(xCoords, yCoords, '.', label='Track Nodes', color='black')
+        plt.plot(xPath[0], yPath[0], 'D', label='Start Node', color='g')
+        plt.plot(startX, startY, 'D', label='Finish Node', color='r')
+        plt.xlabel('X-axis')
+        plt.ylabel('Y-axis')
+        plt.title(f'Number of nodes in path: {numNodes}', loc='center')
+
+        plt.plot(markedX, markedY, '-', label='Car Path', color='b')
+        if raceline is not None:
+            plt.plot(np.append(raceline[0], raceline[0][0]), np.append(raceline[1], raceline[1][0]), '-', label='Raceline', color='r')
+        plt.legend()
+
+        paths += saveFigure(fig, name, folder, renders)
+        finishFigure(fig)
+    return paths
 
 def main():
     """
@@ -432,8 +231,6 @@ def main():
                 if size > 0:
                     if size < 50:
                         print('Enter a size larger than 50.')
-                    elif size > (1500*os.cpu_count()):
-                        print(f'Enter a size smaller than','{:,}.'.format(1500*os.cpu_count()))
                     else:
                         break
                 else:
@@ -445,39 +242,14 @@ def main():
 
         startTime = time.time()
 
-        # Open image
-        img = Image.open(imagePath)
-
-        # Scale it to size
-        img = img.resize((size, size), resample=Image.BOX)
+        # Metrics cover one run, from building the track to rendering its lap
+        resetMetrics()
 
-        # Split the image into sections
-        width, height = img.size
-        num_processes = os.cpu_count()  # Number of processes
-        section_width = width // num_processes
-        image_sections = [(img.crop((i * section_width, 0, (i + 1) * section_width, height)), (section_width, height), (i * section_width, 0)) for i in range(num_processes)]
+        # The session keeps the track in memory, so trying other start points on it only runs the search again
+        session = TrackSession(imagePath, size)
+        xCoords, yCoords, trackGrid = session.xCoords, session.yCoords, session.trackGrid
 
-        # Evaluates if multiprocessing is needed or will it slow it down
-        if size > 1750:
-            print('Starting multiple processes...')
-             # Create a multiprocessing Pool
-            pool = Pool()
-
-            # Use pool.map() to run the function in parallel
-            results = pool.map(processImageSection, image_sections)
-
-            pool.close()
-            pool.join()
-
-            # Combine the results
-            xCoords = sum((result[0] for result in results), [])
-            yCoords = sum((result[1] for result in results), [])
-            total_nodes = sum(int(result[2]) for result in results)
-        else:
-            print('Starting a single process...')
-            xCoords, yCoords, total_nodes = processImageSection([img,(size,size),(0,0)])
-
-        numNodes = "{:,}".format(total_nodes)
+        numNodes = "{:,}".format(session.totalNodes)
 
         endTime = time.time()
 
@@ -486,43 +258,90 @@ def main():
         print(f'\nWait time was: {round(endTime-startTime,2)} seconds.')
 
         print('\nFind the starting X and Y coordinates as well as the starting direction.')
-        plotNodes(xCoords, yCoords, numNodes)
-
-        directions = {
-            1:['N','0100'],
-            2:['NE','0101'],
-            3:['E','0001'],
-            4:['SE','1101'],
-            5:['S','1100'],
-            6:['SW','1111'],
-            7:['W','0011'],
-            8:['NW','0111'],
-        }
+        trackName = os.path.splitext(image)[0]
+        if isHeadless():
+            # Without a display the nodes are saved so they can be opened to pick a start point
+            nodesPath = plotNodes(xCoords, yCoords, numNodes, runName(trackName, size, 'nodes'))[0]
+            print(f'Track nodes saved to {nodesPath}.')
+        else:
+            plotNodes(xCoords, yCoords, numNodes)
+
+        # Track coordinates as sets so checking a typed start point does not scan every node
+        trackXs = set(np.unique(xCoords).tolist())
+        trackYs = set(np.unique(yCoords).tolist())
 
         while True:
-            try:
-                # TODO implement ways to not have to restart
-                xCoord = int(input('\nEnter starting X coordinate: '))
-                if xCoord in xCoords:
-                    yCoord = int(input('Enter starting Y coordinate: '))
-                    if yCoord in yCoords:
-                        print('\nRelative cardinal direction of the track:')
-                        for key in directions:
-                            print(f'{key}. {directions[key][0]}')
-                        try:
-                            choice = directions[int(input('\nPick a starting direction: '))]
-                            print(f"You selected: {choice[0]}")
-                            break
-                        except Exception as e:
-                            print('Invalid choice.')
+            while True:
+                try:
+                    xCoord = int(input('\nEnter starting X coordinate: '))
+                    if xCoord in trackXs:
+                        yCoord = int(input('Enter starting Y coordinate: '))
+                        if yCoord in trackYs:
+                            print('\nRelative cardinal direction of the track:')
+                            for key in directions:
+                                print(f'{key}. {directions[key][0]}')
+                            try:
+                                choice = directions[int(input('\nPick a starting direction: '))]
+                                print(f"You selected: {choice[0]}")
+                                break
+                            except Exception as e:
+                                print('Invalid choice.')
+                        else:
+                            print("Y Coordinate not in graph bounds.")
                     else:
-                        print("Y Coordinate not in graph bounds.")
+                        print("X Coordinate not in graph bounds.")
+                except Exception as e:
+                    print('Invalid coordinate.')
+
+            searchModes = {
+                1:['Greedy','greedy'],
+                2:['Shortest lap','optimal'],
+                3:['Center line','skeleton'],
+                4:['Coarse to fine','multiresolution'],
+                5:['Bidirectional shortest lap','bidirectional'],
+            }
+
+            print('\nSearch modes:')
+            for key in searchModes:
+                print(f'{key}. {searchModes[key][0]}')
+            while True:
+                try:
+                    mode = searchModes[int(input('\nPick a search mode: '))]
+                    print(f"You selected: {mode[0]}")
+                    break
+                except Exception as e:
+                    print('Invalid choice.')
+
+            while True:
+                try:
+                    minClearance = float(input('\nEnter the clearance to keep from the track edge in nodes (0 for none): ') or 0)
+                    if minClearance >= 0:
+                        break
+                    print('Enter a clearance of 0 or more.')
+                except Exception as e:
+                    print('Invalid clearance.')
+
+            # The distance of every node from the edge is only built once a run asks to keep clear of it, the session keeps it for later starts
+            clearance = session.clearance if minClearance > 0 else None
+
+            start(xCoord,yCoord,choice[1], xCoords, yCoords, trackGrid, mode[1], runName(trackName, size, mode[1]), {'track': image, 'size': size}, clearance, minClearance, session.searchCache)
+
+            again = False
+            while True:
+                choice = str(input('Try another start on this track? (y/n): '))
+                if choice == 'y':
+                    again = True
+                    break
+                elif choice == 'n':
+                    again = False
+                    break
                 else:
-                    print("X Coordinate not in graph bounds.")
-            except Exception as e:
-                print('Invalid coordinate.')
+                    print('Invalid choice.')
+            if not again:
+                break
 
-        start(xCoord,yCoord,choice[1], xCoords, yCoords)
+            # Each query on the session is its own run
+            resetMetrics()
 
         more = False
         while True:
@@ -1,12 +1,15 @@
-from PIL import Image
-import matplotlib.pyplot as plt
-from matplotlib.animation import PillowWriter
 import os
 import time
-from multiprocessing import Pool, freeze_support, cpu_count
+from multiprocessing import freeze_support, cpu_count
 import concurrent.futures
-import random
 import math
+import numpy as np
+from headings import headingX, headingY, moveCodes, parseHeading
+from lapOutput import finishFigure, isHeadless, outputFolder, pyplot, runName, saveFigure, saveLap
+from randomWalks import findStartBatchShared, initWorker
+from sharedTrack import shareTrackGrid
+from runMetrics import mergeMetrics, metricsReport, record, resetMetrics, stage, writeMetrics
+from trackKernels import buildTrack, buildTrackGrid
 
 class BackgroundColors:
     RESET = '\033[0m'
@@ -19,39 +22,18 @@ class BackgroundColors:
     CYAN = '\033[46m'
     WHITE = '\033[47m'
 
-def is_black(pixel, threshold=150):
-    # Calculate luminance as a measure of intensity (brightness)
-    if type(pixel) == int:
-        luminance = 0
-    else:
-        luminance = 0.299 * pixel[0] + 0.587 * pixel[1] + 0.114 * pixel[2]
-    # Check if luminance is below the threshold
-    return luminance <= threshold
-
-def processImageSection(args):
-    image_section, size, offset = args
-    width, height = size
-
-    i = 0
-    xCoords = []
-    yCoords = []
-    for y in range(height):
-        for x in range(width):
-            pixel = image_section.getpixel((x, y))
-            if is_black(pixel):
-                i += 1
-                xCoords.append(x + offset[0])
-                yCoords.append(-y + height + offset[1])
-
-    return xCoords, yCoords, i
-
-def plotNodes(xCoords, yCoords):
+def plotNodes(xCoords, yCoords, name=None):
+    plt = pyplot()
+    fig = plt.figure()
     plt.plot(xCoords, yCoords, '.', label='Track Nodes', color='black')
     plt.xlabel('X-axis')
     plt.ylabel('Y-axis')
     plt.title('Track Map with Nodes')
     plt.legend()
-    plt.show()
+
+    paths = [] if name is None else saveFigure(fig, name, formats=('png',))
+    finishFigure(fig)
+    return paths
 
 def printTracks(tracksFolder):
     # Get the absolute path based on the current working directory
@@ -84,128 +66,11 @@ def printTracks(tracksFolder):
     print(f"You selected: {chosenTrack.split('.')[0].capitalize()}")
     return chosenTrack
 
-getMove = {
-    '0111':['0011','0111','0100'],
-    '0100':['0111','0100','0101'],
-    '0101':['0100','0101','0001'],
-    '0011':['1111','0011','0111'],
-    '0001':['0101','0001','1101'],
-    '1111':['0011','1111','1100'],
-    '1100':['1111','1100','1101'],
-    '1101':['1100','1101','0001']
-}
-
-def choosePath(moves, currPosX, currPosY, xCoords, yCoords, startX, startY, visited):
-    nextMove = []
-    nextDist = 1e7 # Infinity
-    for move in moves:
-        iNeg = int(move[0])
-        jNeg = int(move[2])
-        i = int(move[1])
-        j = int(move[3])
-        if iNeg:
-            i *= -1
-        if jNeg:
-            j *= -1
-        nextX = currPosX + j
-        nextY = currPosY + i
-        coords = (nextX,nextY)
-        if nextX in xCoords and nextY in yCoords:
-            xIndex = [i for i, x in enumerate(xCoords) if x == nextX]
-            yIndex = [i for i, y in enumerate(yCoords) if y == nextY]
-
-            if any(index in yIndex for index in xIndex) and coords not in visited:
-                xDist = abs(startX - nextX)
-                yDist = abs(startY - nextY)
-                dist = xDist + yDist
-                if dist < nextDist:
-                    nextDist = dist
-                    nextMove.append(coords)
-        else:
-            try:
-                nextMove.pop()
-            except IndexError:
-                nextMove = []
-    try:
-        return nextMove[-1]
-    except IndexError:
-        return None, None
-
-def findStart(startX, startY, direction, startDirX, startDirY, xCoords, yCoords, numberToBeatHigh, numberToBeatLow):
-    nodeCount = 1e7
-    path = None
-    pathCounter = 1
-    nodes = 0
-    pathsChecked = 0
-    fullRangeX = max(xCoords) - min(xCoords)
-    fullRangeY = max(yCoords) - min(yCoords)
-    while path == None or pathCounter < 1:
-        currPosX = startDirX
-        currPosY = startDirY
-        moves = getMove[direction]
-        currPathX = [currPosX]
-        currPathY = [currPosY]
-        movesPath = []
-        visited = [(currPosX,currPosY)]
-        try:
-            i = 0
-            nodes = 0
-            while (currPosX,currPosY) != (startX, startY):
-                moves = getMove[moves[random.randint(0,2)]]
-                currPosX, currPosY = choosePath(moves, currPosX, currPosY, xCoords, yCoords, startX, startY, visited)
-                if currPosX == None:
-                    if i == 100:
-                        raise Exception
-                    currPosX = currPathX.pop()
-                    currPosY = currPathY.pop()
-                    moves = movesPath.pop()
-                    # visited.pop()
-                    i += 1
-                    nodes -= 1
-                else:
-                    currPathX.append(currPosX)
-                    currPathY.append(currPosY)
-                    movesPath.append(moves)
-                    visited.append((currPosX, currPosY))
-                    nodes += 1
-
-                xRange = (max(currPathX) - min(currPathX)) / fullRangeX
-                yRange = (max(currPathY) - min(currPathY)) / fullRangeY
-
-                if (currPosX,currPosY) == (startX, startY) and xRange < 0.9 and yRange < 0.9:
-                    # Reset the path if range conditions are not met
-                    currPosX = startDirX
-                    currPosY = startDirY
-                    moves = getMove[direction]
-                    currPathX = [currPosX]
-                    currPathY = [currPosY]
-                    movesPath = []
-                    visited = [(currPosX, currPosY)]
-            
-            if nodes <= nodeCount and nodes < numberToBeatHigh and nodes > numberToBeatLow and moves[1] == direction:
-                print('Path found.')
-                print(f'{nodes} Nodes.')
-                nodeCount = nodes
-                path = (currPathX, currPathY)
-                pathCounter += 1
-                pathsChecked += 1
-        except Exception as e:
-            pathsChecked += 1
-            if pathsChecked>500:
-                return None,1e7
-    print(f'Checked {pathsChecked} paths.\n')
-
-    return path, nodeCount
-
-def start(x, y, direction, xCoords, yCoords, numNodes):
-    iNeg = int(direction[0])
-    jNeg = int(direction[2])
-    i = int(direction[1])
-    j = int(direction[3])
-    if iNeg:
-        i *= -1
-    if jNeg:
-        j *= -1
+def start(x, y, direction, xCoords, yCoords, trackGrid, numNodes, name=None, info=None, seed=None):
+    # Searches only work with heading IDs, move strings stop here
+    direction = parseHeading(direction)
+    j = headingX[direction]
+    i = headingY[direction]
 
     resultsList = []
     results = [0, numNodes*.5]
@@ -222,99 +87,132 @@ def start(x, y, direction, xCoords, yCoords, numNodes):
 
     # ! Maybe I can make it where the path is recursively passed to the algorithm and it get the start and then 10 indexes into the path and it find the shortest path that way
 
-    while True:
-        print(f'\nStarting iteration {iteration}')
-        print(f'\nSearching paths with at most {results[1]} nodes.\n')
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            futures = {executor.submit(findStart, x, y, direction, x+j, y+i, xCoords, yCoords, results[1], 0) for _ in range(numProcesses)}
-
-            for future in concurrent.futures.as_completed(futures):
-                result = future.result()
-                resultsList.append(result)
-                if result[1] < 1e7:
-                    numNodeData.append((iteration, result[1]))
-
-        # Calculate new minimum result
-        new_results = min(resultsList, key=lambda x: x[1])
-
-        if new_results[1] == 1e7 and len(resultsList) == numProcesses:
-            print('No path found.\n')
-            path = False
-            break
+    # Put the track in shared memory once so only its name goes to the workers
+    sharedGrid, gridHandle = shareTrackGrid(trackGrid)
+
+    # Every worker of every iteration walks its own random stream, all drawn from one seed so a run can be repeated.
+    # The workers prune against the best lap of the previous iteration only, laps other workers find during an iteration
+    # would make what gets pruned depend on timing
+    seeds = np.random.SeedSequence(seed)
+    print(f'Random seed: {seeds.entropy}')
+
+    # One pool for every iteration so workers are only started once
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=numProcesses, initializer=initWorker, initargs=(gridHandle, None))
+
+    try:
+        while True:
+            print(f'\nStarting iteration {iteration}')
+            print(f'\nSearching paths with at most {results[1]} nodes.\n')
+            # Only the walks are timed as the search, the passes through the stage add up over the iterations
+            with stage('search'):
+                futures = [executor.submit(findStartBatchShared, x, y, direction, x+j, y+i, results[1], 0, workerSeed) for workerSeed in seeds.spawn(numProcesses)]
+
+                # Collected in seed order so laps with the same node count are always picked the same way
+                for future in futures:
+                    lap, lapNodes, workerMetrics = future.result()
+                    mergeMetrics(workerMetrics)
+                    result = (lap, lapNodes)
+                    resultsList.append(result)
+                    if result[1] < 1e7:
+                        numNodeData.append((iteration, result[1]))
+
+            # Calculate new minimum result
+            new_results = min(resultsList, key=lambda x: x[1])
+
+            if new_results[1] == 1e7 and len(resultsList) == numProcesses:
+                print('No path found.\n')
+                path = False
+                break
         
-        print(f'Minimum number of nodes in iteration {iteration}: {new_results[1]}')
+            print(f'Minimum number of nodes in iteration {iteration}: {new_results[1]}')
+            record('bestNodes', new_results[1])
 
-        # Calculate relative improvement
-        improvement = abs(results[1] - new_results[1]) / results[1]
+            # Calculate relative improvement
+            improvement = abs(results[1] - new_results[1]) / results[1]
 
-        if iteration > 3 and improvement > 0:
-            stopIteration = 10 + iteration
-            print(f'Iterating until iteration {stopIteration}')
+            if iteration > 3 and improvement > 0:
+                stopIteration = 10 + iteration
+                print(f'Iterating until iteration {stopIteration}')
 
-        print(f'Improved {round(improvement*100,4)}%')
+            print(f'Improved {round(improvement*100,4)}%')
 
-        # if iteration:
-        improvementData.append((iteration, round(improvement*100,4)))
+            # if iteration:
+            improvementData.append((iteration, round(improvement*100,4)))
 
-        if iteration == stopIteration:
-            numNodeData.append((iteration, new_results[1]))
-            break
-        else:
-            results = new_results
-            iteration +=1
+            if iteration == stopIteration:
+                numNodeData.append((iteration, new_results[1]))
+                break
+            else:
+                results = new_results
+                iteration +=1
+    finally:
+        executor.shutdown(cancel_futures=True)
+        sharedGrid.close()
+        sharedGrid.unlink()
 
     endTime = time.time()
 
     print(f'Wait time was: {round(endTime-startTime, 2)} seconds.')
 
-    if path:
-        # Plot the improvement data
-        iterationsImp, improvement = zip(*improvementData)
-        # iterationsNod, nodes = zip(*numNodeData)
-        # plt.plot(iterationsNod, nodes, '.', label='Nodes', color='b')
-        # plt.xlabel('Iterations')
-        # plt.ylabel('Number of nodes')
-        # plt.title('Number of Nodes per Iteration', loc='center')
-        # plt.legend()
-        # plt.show()
-
-        plt.bar(iterationsImp, improvement, color='b', alpha=0.7)
-        plt.ylim(0,100)
-        plt.xlabel('Iterations')
-        plt.ylabel('Improvement Percentage')
-        plt.title('Improvement per Iteration')
-        plt.show()
-
-        # Plot the final path
-        fig = plt.figure()
-        plt.plot(xCoords, yCoords, '.', label='Track Nodes', color='black')
-        l, = plt.plot([], [], '-', color='b')
-        plt.plot(x+j, y+i, 'D', label='Start Node', color='g')
-        plt.plot(x, y, 'D', label='Finish Node', color='r')
-        plt.xlabel('X-axis')
-        plt.ylabel('Y-axis')
-        plt.title(f'Number of nodes in path: {results[1]}', loc='center')
-
-        metadata = dict(title=f'Number of nodes in path: {results[1]}')
-        writer = PillowWriter(fps=20, metadata=metadata)
-
-        xData = []
-        yData = []
-
-        with writer.saving(fig, "TrackVisualization.gif", 100):
-            for i in range(len(results[0][0])):
-                xData.append(results[0][0][i])
-                yData.append(results[0][1][i])
-
-                l.set_data(xData, yData)
-
-                writer.grab_frame()
-            for _ in range(20):  # Add 20 duplicate frames (2 seconds pause)
-                writer.grab_frame()
-
-        plt.plot(results[0][0], results[0][1], '-', label='Car Path', color='b')
-        plt.legend()
-        plt.show()
+    runInfo = dict(info or {}, startX=x, startY=y, direction=moveCodes[direction], mode='random', seed=seeds.entropy, iterations=iteration, searchTime=round(endTime-startTime, 4))
+
+    if not path:
+        writeMetrics(runInfo)
+    else:
+        # Smoothing and rendering are imported on first use so the workers searching above never load them
+        from pathAnimation import exportAnimation
+        from raceline import smoothLap
+
+        plt = pyplot()
+        # Every run writes its own files so runs never overwrite each other
+        if name is None:
+            name = runName('random')
+        # A smooth curve through the lap measures its length and draws it from a point every few nodes
+        smoothX, smoothY, lapLength = smoothLap(results[0][0], results[0][1])
+        print(f'Lap length: {round(lapLength,1)} nodes.')
+
+        with stage('render'):
+            # Plot the improvement data
+            iterationsImp, improvement = zip(*improvementData)
+            # iterationsNod, nodes = zip(*numNodeData)
+            # plt.plot(iterationsNod, nodes, '.', label='Nodes', color='b')
+            # plt.xlabel('Iterations')
+            # plt.ylabel('Number of nodes')
+            # plt.title('Number of Nodes per Iteration', loc='center')
+            # plt.legend()
+            # plt.show()
+
+            fig = plt.figure()
+            plt.bar(iterationsImp, improvement, color='b', alpha=0.7)
+            plt.ylim(0,100)
+            plt.xlabel('Iterations')
+            plt.ylabel('Improvement Percentage')
+            plt.title('Improvement per Iteration')
+            saveFigure(fig, f'{name}_improvement', formats=('png',))
+            finishFigure(fig)
+
+            # Animate the final path without redrawing the figure for every node
+            exportAnimation(np.append(smoothX, smoothX[0]), np.append(smoothY, smoothY[0]), xCoords, yCoords, os.path.join(outputFolder, f'{name}.gif'), results[1])
+
+            # Plot the final path
+            fig = plt.figure()
+            plt.plot(xCoords, yCoords, '.', label='Track Nodes', color='black')
+            plt.plot(x+j, y+i, 'D', label='Start Node', color='g')
+            plt.plot(x, y, 'D', label='Finish Node', color='r')
+            plt.xlabel('X-axis')
+            plt.ylabel('Y-axis')
+            plt.title(f'Number of nodes in path: {results[1]}', loc='center')
+
+            plt.plot(np.append(smoothX, smoothX[0]), np.append(smoothY, smoothY[0]), '-', label='Car Path', color='b')
+            plt.legend()
+            saveFigure(fig, name, formats=('png',))
+            finishFigure(fig)
+
+        # Saved after rendering so the metrics written with the lap cover every stage of the run
+        runInfo.update(lapLength=round(lapLength, 2), metrics=metricsReport())
+        saveLap(results[0][0], results[0][1], name, info=runInfo)
+        writeMetrics(runInfo)
+        print(f'Lap saved to {os.path.join(outputFolder, name)}.')
 
 def timeEstimate(x):
     return round((x/os.cpu_count()/43), 2)
@@ -330,8 +228,6 @@ def main():
                 if size > 0:
                     if size < 50:
                         print('Enter a size larger than 50.')
-                    elif size > (1500*os.cpu_count()):
-                        print(f'Enter a size smaller than','{:,}.'.format(1500*os.cpu_count()))
                     else:
                         break
                 else:
@@ -344,35 +240,12 @@ def main():
 
         startTime = time.time()
 
-        # Open image
-        img = Image.open(imagePath)
+        # Metrics cover one run, from building the track to rendering its lap
+        resetMetrics()
 
-        # Scale it to size
-        img = img.resize((size, size), resample=Image.BOX)
+        xCoords, yCoords, total_nodes = buildTrack(imagePath, size)
 
-        # Split the image into sections
-        width, height = img.size
-        num_processes = os.cpu_count()  # Number of processes
-        section_width = width // num_processes
-        image_sections = [(img.crop((i * section_width, 0, (i + 1) * section_width, height)), (section_width, height), (i * section_width, 0)) for i in range(num_processes)]
-
-        # Evaluates if multiprocessing is needed or will it slow it down
-        if size > 1750:
-             # Create a multiprocessing Pool
-            pool = Pool()
-
-            # Use pool.map() to run the function in parallel
-            results = pool.map(processImageSection, image_sections)
-
-            pool.close()
-            pool.join()
-
-            # Combine the results
-            xCoords = sum((result[0] for result in results), [])
-            yCoords = sum((result[1] for result in results), [])
-            total_nodes = sum(int(result[2]) for result in results)
-        else:
-            xCoords, yCoords, total_nodes = processImageSection([img,(size,size),(0,0)])
+        trackGrid = buildTrackGrid(xCoords, yCoords)
 
         numNodes = "{:,}".format(total_nodes)
 
@@ -382,7 +255,13 @@ def main():
         print(f'Number of track nodes: {numNodes}') # Number of sections the track was split into
 
         print('\nFind the starting X and Y coordinates as well as the starting direction.')
-        plotNodes(xCoords, yCoords)
+        trackName = os.path.splitext(image)[0]
+        if isHeadless():
+            # Without a display the nodes are saved so they can be opened to pick a start point
+            nodesPath = plotNodes(xCoords, yCoords, runName(trackName, size, 'nodes'))[0]
+            print(f'Track nodes saved to {nodesPath}.')
+        else:
+            plotNodes(xCoords, yCoords)
 
         directions = {
             1:['N','0100'],
@@ -395,13 +274,18 @@ def main():
             8:['NW','0111'],
         }
 
+        # Track coordinates as sets so checking a typed start point does not scan every node
+        trackXs = set(np.unique(xCoords).tolist())
+        trackYs = set(np.unique(yCoords).tolist())
+
         while True:
             try:
                 # TODO implement ways to not have to restart
                 xCoord = int(input('Enter starting X coordinate: '))
-                if xCoord <= width:
+                if xCoord in trackXs:
                     yCoord = int(input('Enter starting Y coordinate: '))
-                    if yCoord <= height:
+                    # The walkers start from a track node, anything else is off the track grid or off the track
+                    if yCoord in trackYs and trackGrid[xCoord, yCoord]:
                         print('Relative cardinal directions:')
                         # TODO add int error checking
                         for key in directions:
@@ -419,7 +303,7 @@ def main():
             except Exception as e:
                 print('Invalid coordinate.')
 
-        start(xCoord,yCoord,choice[1], xCoords, yCoords, total_nodes)
+        start(xCoord,yCoord,choice[1], xCoords, yCoords, trackGrid, total_nodes, runName(trackName, size, 'random'), {'track': image, 'size': size})
 
         more = False
         while True:
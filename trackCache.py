@@ -0,0 +1,281 @@
+import argparse
+import hashlib
+import os
+import time
+import numpy as np
+
+# Folder the extracted tracks are cached in and how large it is allowed to grow
+cacheFolder = '.trackCache'
+maxCacheBytes = 512 * 1024 * 1024
+
+# Seconds a temporary entry can go unwritten before it is taken to be left over from a build that never finished
+staleTempSeconds = 60 * 60
+
+# Hashes of the images seen so far, keyed by path, modification time and size so an edited image is hashed again
+imageHashes = {}
+
+def imageHash(imagePath):
+    """
+    Hashes the contents of a track image so edited images never hit a stale cache entry.
+
+    The hash is kept for as long as the file's modification time and size stay the same, so looking up every cache entry
+    of one build only reads the image once.
+
+    Parameters:
+    - imagePath (str): Path to the track image.
+
+    Returns:
+    - str: Hex digest of the image contents.
+    """
+
+    stat = os.stat(imagePath)
+    key = (os.path.abspath(imagePath), stat.st_mtime_ns, stat.st_size)
+    if key not in imageHashes:
+        digest = hashlib.sha256()
+        with open(imagePath, 'rb') as imageFile:
+            for chunk in iter(lambda: imageFile.read(1 << 20), b''):
+                digest.update(chunk)
+        imageHashes[key] = digest.hexdigest()
+    return imageHashes[key]
+
+def cachePath(imagePath, size, threshold, folder=cacheFolder, kind=''):
+    """
+    Gets the path a track is cached at.
+
+    Parameters:
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold used to classify track nodes.
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+    - kind (str): What is cached for the track, such as 'clearance'. Defaults to the track mask.
+
+    Returns:
+    - str: Path to the cached entry.
+    """
+
+    suffix = f'_{kind}' if kind else ''
+    return os.path.join(folder, f'{imageHash(imagePath)[:32]}_{size}_{threshold}{suffix}.npy')
+
+def loadEntry(path):
+    """
+    Loads a cache entry memory mapped and marks it as recently used.
+
+    Parameters:
+    - path (str): Path to the entry.
+
+    Returns:
+    - numpy.ndarray or None: The cached array, or None if there is no usable entry.
+    """
+
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        entry = np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        # A damaged entry is dropped so it gets rebuilt
+        os.remove(path)
+        return None
+
+    # Touch the entry so eviction removes the least recently used tracks first
+    os.utime(path)
+    return entry
+
+def loadTrackMask(imagePath, size, threshold=150, folder=cacheFolder):
+    """
+    Loads a cached track mask, memory mapped so nothing is read until it is used.
+
+    Parameters:
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold used to classify track nodes. Defaults to 150.
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+
+    Returns:
+    - numpy.ndarray or None: Boolean mask in image orientation, or None if the track is not cached.
+    """
+
+    return loadEntry(cachePath(imagePath, size, threshold, folder))
+
+def loadClearance(imagePath, size, threshold=150, folder=cacheFolder):
+    """
+    Loads the cached clearance of a track, memory mapped so nothing is read until it is used.
+
+    Parameters:
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold used to classify track nodes. Defaults to 150.
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+
+    Returns:
+    - numpy.ndarray or None: Clearance grid indexed like the track grid, or None if it is not cached.
+    """
+
+    return loadEntry(cachePath(imagePath, size, threshold, folder, 'clearance'))
+
+def saveClearance(clearance, imagePath, size, threshold=150, folder=cacheFolder, maxBytes=maxCacheBytes):
+    """
+    Saves the clearance of a track next to its mask and evicts old entries if the cache grew too large.
+
+    Parameters:
+    - clearance (numpy.ndarray): Clearance grid indexed like the track grid.
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold used to classify track nodes. Defaults to 150.
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+    - maxBytes (int): Largest size the cache is allowed to grow to. Defaults to maxCacheBytes.
+
+    Returns:
+    - None
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    path = cachePath(imagePath, size, threshold, folder, 'clearance')
+    # Write to a temporary file first so other processes never load a half written entry
+    tempPath = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tempPath, 'wb') as entryFile:
+            np.save(entryFile, clearance)
+        os.replace(tempPath, path)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+    evictCache(folder, maxBytes, keep=path)
+
+def createTrackMask(shape, imagePath, size, threshold=150, folder=cacheFolder):
+    """
+    Creates an empty cache entry for a track mask, memory mapped so it can be filled a tile at a time without holding it in memory.
+
+    The entry is written to a temporary file and only becomes visible to loadTrackMask once it is flushed, closed
+    and passed to commitTrackMask.
+
+    Parameters:
+    - shape (tuple): Rows and columns of the mask.
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold used to classify track nodes. Defaults to 150.
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+
+    Returns:
+    - numpy.memmap: Writable boolean mask in image orientation, filled with False.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    # Write to a temporary file first so other processes never load a half written entry
+    tempPath = f'{cachePath(imagePath, size, threshold, folder)}.{os.getpid()}.tmp'
+    return np.lib.format.open_memmap(tempPath, mode='w+', dtype=bool, shape=shape)
+
+def commitTrackMask(tempPath, imagePath, size, threshold=150, folder=cacheFolder, maxBytes=maxCacheBytes):
+    """
+    Moves a mask from createTrackMask into place in the cache and evicts old entries if the cache grew too large.
+
+    Parameters:
+    - tempPath (str): Filename of the filled and closed mask from createTrackMask.
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold used to classify track nodes. Defaults to 150.
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+    - maxBytes (int): Largest size the cache is allowed to grow to. Defaults to maxCacheBytes.
+
+    Returns:
+    - None
+    """
+
+    path = cachePath(imagePath, size, threshold, folder)
+    os.replace(tempPath, path)
+    # The new entry stays even if it is larger than the cache, it is about to be loaded
+    evictCache(folder, maxBytes, keep=path)
+
+def evictCache(folder=cacheFolder, maxBytes=maxCacheBytes, keep=None):
+    """
+    Removes the least recently used entries until the cache fits in the given size.
+
+    Temporary entries left over from builds that failed or were killed are removed too, once nothing has written to them for staleTempSeconds.
+
+    Parameters:
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+    - maxBytes (int): Largest size the cache is allowed to be. Defaults to maxCacheBytes.
+    - keep (str): Path of an entry that is never removed, even if it is larger than the whole cache. Defaults to none.
+
+    Returns:
+    - int: Number of entries removed.
+    """
+
+    if not os.path.isdir(folder):
+        return 0
+
+    removed = 0
+    entries = []
+    for entry in os.scandir(folder):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        if entry.name.endswith('.npy'):
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        elif entry.name.endswith('.tmp') and time.time() - stat.st_mtime > staleTempSeconds:
+            os.remove(entry.path)
+            removed += 1
+
+    totalBytes = sum(entry[1] for entry in entries)
+    for _, entryBytes, path in sorted(entries):
+        if totalBytes <= maxBytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        totalBytes -= entryBytes
+        removed += 1
+    return removed
+
+def clearCache(imagePaths=None, folder=cacheFolder):
+    """
+    Invalidates cached tracks.
+
+    Parameters:
+    - imagePaths (list): Track images to invalidate every size and threshold of. Clears the whole cache if None.
+    - folder (str): Folder holding the cache. Defaults to cacheFolder.
+
+    Returns:
+    - int: Number of entries removed.
+    """
+
+    if not os.path.isdir(folder):
+        return 0
+
+    prefixes = None if imagePaths is None else tuple(imageHash(imagePath)[:32] for imagePath in imagePaths)
+
+    removed = 0
+    for entry in os.scandir(folder):
+        if entry.is_file() and (prefixes is None or entry.name.startswith(prefixes)):
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+def main():
+    """
+    Command line entry point for managing the track cache.
+
+    Returns:
+    - None
+    """
+
+    parser = argparse.ArgumentParser(description='Manage the cache of extracted tracks.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    clearParser = commands.add_parser('clear', help='Invalidate cached tracks.')
+    clearParser.add_argument('images', nargs='*', help='Track images to invalidate. Clears everything if none are given.')
+
+    evictParser = commands.add_parser('evict', help='Shrink the cache to a maximum size.')
+    evictParser.add_argument('--max-mb', type=float, default=maxCacheBytes / (1024 * 1024), help='Maximum cache size in megabytes.')
+
+    args = parser.parse_args()
+
+    if args.command == 'clear':
+        removed = clearCache(args.images or None)
+    else:
+        removed = evictCache(maxBytes=int(args.max_mb * 1024 * 1024))
+    print(f'Removed {removed} cached tracks.')
+
+if __name__ == "__main__":
+    main()
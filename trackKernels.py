@@ -0,0 +1,995 @@
+import numpy as np
+import os
+from array import array
+from collections import deque
+from multiprocessing import Barrier, Pipe, Pool, Process, RawValue, shared_memory
+from threading import BrokenBarrierError
+from PIL import Image
+from headings import headingX, headingY, nextHeadings, oppositeHeadings
+from runMetrics import count, profiled, stage
+from trackCache import commitTrackMask, createTrackMask, loadClearance, loadTrackMask, saveClearance
+from trackSkeleton import buildSkeletonGraph, findSkeletonLap
+
+def is_black(pixel, threshold=150):
+    """
+    Determines whether a given pixel is considered black based on its luminance.
+
+    Parameters:
+    - pixel (int or tuple): Pixel value as a single intensity value or a tuple (R, G, B).
+    - threshold (int): Luminance threshold to classify a pixel as black. Defaults to 100.
+
+    Returns:
+    - bool: True if the pixel is black, False otherwise.
+    """
+
+    # Calculate luminance as a measure of intensity (brightness)
+    if type(pixel) == int:
+        luminance = 0
+    else:
+        luminance = 0.299 * pixel[0] + 0.587 * pixel[1] + 0.114 * pixel[2]
+    # Check if luminance is below the threshold
+    return luminance <= threshold
+
+def trackMask(image, threshold=150):
+    """
+    Classifies every pixel of an image as track or not in a single vectorized pass.
+
+    Parameters:
+    - image (PIL.Image): Image to classify.
+    - threshold (int): Luminance threshold to classify a pixel as black. Defaults to 150.
+
+    Returns:
+    - numpy.ndarray: Boolean array in image orientation (rows, columns), True where the pixel is black.
+    """
+
+    pixels = np.asarray(image)
+
+    # Single band pixels come back as ints, which is_black always treats as black
+    if pixels.ndim < 3:
+        return np.ones(pixels.shape[:2], dtype=bool)
+
+    # Same luminance formula and evaluation order as is_black so results are identical
+    pixels = pixels.astype(np.float64)
+    luminance = 0.299 * pixels[..., 0] + 0.587 * pixels[..., 1] + 0.114 * pixels[..., 2]
+    return luminance <= threshold
+
+def processImageSection(args):
+    """
+    Processes a section of an image to extract track nodes.
+
+    Parameters:
+    - args (tuple): A tuple containing image_section, size, and offset.
+    - image_section: Image section to process.
+    - size: Size of the image section (width, height).
+    - offset: Offset coordinates.
+
+    Returns:
+    - tuple: A tuple containing lists of X and Y coordinates of track nodes and the total count of nodes.
+    """
+
+    image_section, size, offset = args
+    width, height = size
+
+    # Row-major order of nonzero matches the original per-pixel scan
+    rows, cols = np.nonzero(trackMask(image_section)[:height, :width])
+    xCoords = (cols + offset[0]).tolist()
+    yCoords = (height - rows + offset[1]).tolist()
+
+    return xCoords, yCoords, len(xCoords)
+
+# Images this process has opened for tiled extraction, so each worker decodes a track image only once
+openImages = {}
+
+def trackTiles(size, tileSize):
+    """
+    Splits an image scaled to size x size into tiles that cover every pixel, the last row and column of tiles take what is left over.
+
+    Parameters:
+    - size (int): Size the image is scaled to.
+    - tileSize (int): Width and height of a full tile in scaled pixels.
+
+    Yields:
+    - tuple: The box (left, top, right, bottom) of each tile in scaled pixels.
+    """
+
+    for top in range(0, size, tileSize):
+        for left in range(0, size, tileSize):
+            yield left, top, min(left + tileSize, size), min(top + tileSize, size)
+
+def tileMask(img, size, box, threshold=150):
+    """
+    Scales one tile of an image to its place in the image scaled to size x size and classifies its pixels.
+
+    A tile's source box starts at a fractional source pixel, so Pillow works out which source pixels fall under each
+    scaled pixel with slightly different rounding than one resize of the whole image. A scaled pixel sitting on the edge
+    between two source pixels can take the other one, so a tiled mask is close to but not always equal to the mask of
+    the whole scaled image. buildTrack always extracts with the default tile size, so cached masks stay consistent.
+
+    Parameters:
+    - img (PIL.Image): Unscaled track image.
+    - size (int): Size the image is scaled to.
+    - box (tuple): Box (left, top, right, bottom) of the tile in scaled pixels.
+    - threshold (int): Luminance threshold to classify a pixel as black. Defaults to 150.
+
+    Returns:
+    - numpy.ndarray: Boolean array of the tile in image orientation, True where the pixel is black.
+    """
+
+    left, top, right, bottom = box
+    scaleX = img.width / size
+    scaleY = img.height / size
+    with stage('resize'):
+        tile = img.resize((right - left, bottom - top), resample=Image.BOX, box=(left * scaleX, top * scaleY, right * scaleX, bottom * scaleY))
+    with stage('extraction'):
+        return trackMask(tile, threshold)
+
+def extractTile(args):
+    """
+    Classifies one tile in a worker process, opening the track image the first time the worker sees it.
+
+    Parameters:
+    - args (tuple): A tuple containing the image path, size, tile box and threshold.
+
+    Returns:
+    - tuple: A tuple containing the tile box and its mask packed eight pixels to a byte, so little has to be sent back.
+    """
+
+    imagePath, size, box, threshold = args
+    if imagePath not in openImages:
+        openImages.clear()
+        openImages[imagePath] = Image.open(imagePath)
+        openImages[imagePath].load()
+
+    return box, np.packbits(tileMask(openImages[imagePath], size, box, threshold), axis=1)
+
+def extractTrackMask(imagePath, size, threshold=150, out=None, tileSize=1024, processes=None):
+    """
+    Extracts the track mask of an image scaled to size x size one tile at a time, writing each tile straight into the mask.
+
+    Neither the scaled image nor a copy of it for each worker is ever built, only the tiles being worked on, so memory
+    stays bounded however large the size is when the mask is memory mapped.
+
+    Parameters:
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold to classify a pixel as black. Defaults to 150.
+    - out (numpy.ndarray): Preallocated size x size boolean array, such as a memory mapped cache entry, to write into. Defaults to a new array.
+    - tileSize (int): Width and height of a tile in scaled pixels. Defaults to 1024.
+    - processes (int): Number of worker processes. Defaults to every CPU above size 4000 and a single process otherwise.
+
+    Returns:
+    - numpy.ndarray: The filled mask in image orientation, True where the pixel is black.
+    """
+
+    if out is None:
+        out = np.zeros((size, size), dtype=bool)
+    if processes is None:
+        processes = os.cpu_count() if size > 4000 else 1
+
+    tiles = trackTiles(size, tileSize)
+    if processes > 1:
+        print('Starting multiple processes...')
+        # The workers decode and resize their own tiles, so the whole pool is timed as extraction
+        with stage('extraction'), Pool(processes) as pool:
+            # Tiles are written as soon as they come back so finished tiles never pile up
+            for (left, top, right, bottom), packed in pool.imap_unordered(extractTile, ((imagePath, size, box, threshold) for box in tiles)):
+                out[top:bottom, left:right] = np.unpackbits(packed, axis=1, count=right - left).view(bool)
+    else:
+        print('Starting a single process...')
+        with Image.open(imagePath) as img:
+            with stage('decode'):
+                img.load()
+            for left, top, right, bottom in tiles:
+                out[top:bottom, left:right] = tileMask(img, size, (left, top, right, bottom), threshold)
+    return out
+
+def buildTrack(imagePath, size, threshold=150):
+    """
+    Builds the track nodes for a track image scaled to a given size, loading them from the track cache when it can.
+
+    Parameters:
+    - imagePath (str): Path to the track image.
+    - size (int): Size the image is scaled to.
+    - threshold (int): Luminance threshold to classify a pixel as black. Defaults to 150.
+
+    Returns:
+    - tuple: A tuple containing int32 arrays of X and Y coordinates of track nodes and the total count of nodes.
+    """
+
+    mask = loadTrackMask(imagePath, size, threshold)
+
+    if mask is not None:
+        print('Loaded track from cache...')
+    else:
+        # Tiles go straight into the memory mapped cache entry, so the scaled image is never held in memory
+        mask = createTrackMask((size, size), imagePath, size, threshold)
+        tempPath = mask.filename
+        try:
+            extractTrackMask(imagePath, size, threshold, mask)
+            mask.flush()
+            del mask
+
+            commitTrackMask(tempPath, imagePath, size, threshold)
+        except BaseException:
+            # A failed or interrupted extraction leaves no half written entry behind, the map is closed first so it can be removed
+            mask = None
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+        mask = loadTrackMask(imagePath, size, threshold)
+
+    # Same coordinates processImageSection gives, with Y flipped so up is positive.
+    # They are kept as int32 arrays filled a band of rows at a time, so the mask is never expanded into Python ints
+    # or into full size int64 index arrays
+    totalNodes = int(np.count_nonzero(mask))
+    xCoords = np.empty(totalNodes, dtype=np.int32)
+    yCoords = np.empty(totalNodes, dtype=np.int32)
+    filled = 0
+    for top in range(0, mask.shape[0], 1024):
+        rows, cols = np.nonzero(mask[top:top + 1024])
+        xCoords[filled:filled + len(cols)] = cols
+        yCoords[filled:filled + len(cols)] = mask.shape[0] - top - rows
+        filled += len(cols)
+
+    return xCoords, yCoords, totalNodes
+
+def buildTrackGrid(xCoords, yCoords):
+    """
+    Builds an occupancy grid of the track so traversability can be checked in constant time.
+
+    Parameters:
+    - xCoords (numpy.ndarray): X-coordinates of track nodes.
+    - yCoords (numpy.ndarray): Y-coordinates of track nodes.
+
+    Returns:
+    - numpy.ndarray: Boolean grid indexed as trackGrid[x, y], True where there is a track node.
+    """
+
+    xCoords = np.asarray(xCoords)
+    yCoords = np.asarray(yCoords)
+
+    # Two cells of padding past the largest coordinates keep every lookup around the track in bounds,
+    # negative indexes wrap around into the padding
+    trackGrid = np.zeros((xCoords.max() + 3, yCoords.max() + 3), dtype=bool)
+    trackGrid[xCoords, yCoords] = True
+    return trackGrid
+
+def buildClearance(trackGrid):
+    """
+    Measures how far every track node is from the edge of the track with a Euclidean distance transform.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - numpy.ndarray: Float32 grid indexed like trackGrid with the distance from each track node to the nearest node off the track,
+      1 for nodes on the edge and 0 off the track.
+    """
+
+    # SciPy is only imported by processes that build a clearance, search workers get it from the cache
+    from scipy.ndimage import distance_transform_edt
+
+    return distance_transform_edt(trackGrid).astype(np.float32)
+
+def trackClearance(trackGrid, imagePath=None, size=None, threshold=150):
+    """
+    Gets the clearance of every track node, loading it from the track cache when the track came from an image.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - imagePath (str): Path to the track image the grid was built from. The clearance is not cached if None.
+    - size (int): Size the image was scaled to.
+    - threshold (int): Luminance threshold used to classify track nodes. Defaults to 150.
+
+    Returns:
+    - numpy.ndarray: Clearance grid from buildClearance.
+    """
+
+    if imagePath is None:
+        return buildClearance(trackGrid)
+
+    clearance = loadClearance(imagePath, size, threshold)
+    if clearance is not None and clearance.shape == trackGrid.shape:
+        return clearance
+
+    with stage('clearance'):
+        clearance = buildClearance(trackGrid)
+    saveClearance(clearance, imagePath, size, threshold)
+    return clearance
+
+# Menu of starting directions with the move each one starts with
+directions = {
+    1:['N','0100'],
+    2:['NE','0101'],
+    3:['E','0001'],
+    4:['SE','1101'],
+    5:['S','1100'],
+    6:['SW','1111'],
+    7:['W','0011'],
+    8:['NW','0111'],
+}
+
+def moveOffset(heading):
+    """
+    Gets the X and Y step a heading takes on the grid.
+
+    Parameters:
+    - heading (int): Heading ID from headings.
+
+    Returns:
+    - tuple: A tuple containing the X and Y step of the heading.
+    """
+
+    return headingX[heading], headingY[heading]
+
+def pathLength(xPath, yPath):
+    """
+    Measures a closed lap on the grid, a diagonal step counts as the square root of two.
+
+    Parameters:
+    - xPath (list): List of X-coordinates representing the lap.
+    - yPath (list): List of Y-coordinates representing the lap.
+
+    Returns:
+    - float: Length of the lap in track nodes, including the step from its last node back to its first.
+    """
+
+    xPath = np.asarray(xPath, dtype=np.float64)
+    yPath = np.asarray(yPath, dtype=np.float64)
+    return float(np.hypot(np.diff(xPath, append=xPath[:1]), np.diff(yPath, append=yPath[:1])).sum())
+
+def choosePath(moves, currPosX, currPosY, trackGrid, trackColumns, trackRows, startX, startY, visited):
+    """
+    This function determines the next valid move based on a set of possible moves, current position, and visited nodes.
+
+    Parameters:
+    - moves (tuple): Headings that can be moved to, from nextHeadings.
+    - currPosX (int): Current X-coordinate.
+    - currPosY (int): Current Y-coordinate.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - trackColumns (list): Whether each X-coordinate of the grid has any track node.
+    - trackRows (list): Whether each Y-coordinate of the grid has any track node.
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - visited (set): Set of visited coordinates.
+
+    Returns:
+    - tuple: A tuple containing the next coordinates to move to and the corresponding heading.
+      Example: ((nextX, nextY), nextHeading)
+    """
+        
+    nextMove = []
+    nextDist = 1e7 # Infinity
+    nextHeading = moves[0]
+    for move in moves:
+        nextX = currPosX + headingX[move]
+        nextY = currPosY + headingY[move]
+        coords = (nextX,nextY)
+        # If the coordinates are in bounds of the track
+        if trackColumns[nextX] and trackRows[nextY]:
+            # If the coordinates are a track node and have not been visited
+            if trackGrid[nextX, nextY] and coords not in visited:
+                xDist = abs(startX - nextX)
+                yDist = abs(startY - nextY)
+                dist = xDist + yDist
+                # If move is local minimum set to next move
+                if dist < nextDist:
+                    nextDist = dist
+                    nextMove.append(coords)
+                    nextHeading = move
+        else:
+            try:
+                nextMove.pop()
+            except IndexError:
+                nextMove = []
+    try:
+        return (nextMove[-1], nextHeading)
+    except IndexError:
+        return ((None, None), nextHeading)
+
+def findStart(startX, startY, direction, startDirX, startDirY, trackGrid):
+    """
+    This function explores paths from a given starting point in a specified direction and finds the optimal path.
+
+    Parameters:
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - direction (int): Initial heading of movement.
+    - startDirX (int): Initial X-coordinate for direction.
+    - startDirY (int): Initial Y-coordinate for direction.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - tuple or None: A tuple containing two lists of X and Y coordinates representing the optimal path, or None if no path is found.
+    """
+
+    nodeCount = 1e7
+    path = None
+    pathCounter = 1
+    failed = 0
+    countNeeded = 6
+    walks = 0
+    expanded = 0
+    # Columns and rows with any track node, checked before the grid so moves off the track behave as before
+    trackColumns = trackGrid.any(axis=1).tolist()
+    trackRows = trackGrid.any(axis=0).tolist()
+    while path == None or pathCounter < countNeeded:
+        currPosX = startDirX
+        currPosY = startDirY
+        move = direction
+        # The path is kept as array backed stacks and the visited nodes as a set so each step is constant time
+        currPathX = array('i', [currPosX])
+        currPathY = array('i', [currPosY])
+        movesPath = bytearray()
+        visited = {(currPosX,currPosY)}
+        runningX = array('i')
+        runningY = array('i')
+        nodes = 0
+        walks += 1
+        try:
+            # Keeps checking if the position is back at the start
+            while (currPosX,currPosY) != (startX, startY):
+                if failed == 1000:
+                    count('walksStarted', walks)
+                    count('nodesExpanded', expanded)
+                    count('failed', failed)
+                    return (runningX.tolist(), runningY.tolist())
+                moves = nextHeadings[move]
+                coords, move = choosePath(moves, currPosX, currPosY, trackGrid, trackColumns, trackRows, startX, startY, visited)
+                currPosX, currPosY = coords
+                # If no current position, backtrack
+                if currPosX == None:
+                    # To prevent from infinite loop, if it fails 1000 times it breaks out returning the latest path
+                    if failed == 1000:
+                        raise Exception
+                    currPosX = currPathX.pop()
+                    currPosY = currPathY.pop()
+                    move = movesPath.pop()
+                    moves = nextHeadings[move]
+                    visited.discard((currPosX, currPosY))
+                    failed += 1
+                    nodes -= 1
+                else:
+                    currPathX.append(currPosX)
+                    currPathY.append(currPosY)
+                    runningX.append(currPosX)
+                    runningY.append(currPosY)
+                    movesPath.append(moves[1])
+                    visited.add((currPosX, currPosY))
+                    nodes += 1
+                    expanded += 1
+            
+            if nodes <= nodeCount and moves[1] == direction:
+                nodeCount = nodes
+                path = (currPathX.tolist(), currPathY.tolist())
+                pathCounter += 1
+
+        except Exception as e:
+            failed += 1
+            path = (currPathX.tolist(), currPathY.tolist())
+
+    count('walksStarted', walks)
+    count('nodesExpanded', expanded)
+    count('failed', failed)
+    return path
+
+def startLine(startX, startY, direction, trackGrid):
+    """
+    This function finds the start/finish line, the band of track nodes through the start point across the direction of travel.
+
+    Parameters:
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - direction (int): Heading of travel over the line.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - set: Set of coordinates on the start/finish line.
+    """
+
+    dirX, dirY = moveOffset(direction)
+    # One node thick across straight directions, two across diagonals so a diagonal step cannot slip through
+    thickness = abs(dirX) + abs(dirY)
+
+    line = {(startX, startY)}
+    queue = deque(line)
+    while queue:
+        currPosX, currPosY = queue.popleft()
+        for stepX, stepY in zip(headingX, headingY):
+            nextX = currPosX + stepX
+            nextY = currPosY + stepY
+            along = (nextX - startX) * dirX + (nextY - startY) * dirY
+            if 0 <= along < thickness and trackGrid[nextX, nextY] and (nextX, nextY) not in line:
+                line.add((nextX, nextY))
+                queue.append((nextX, nextY))
+    return line
+
+def lapSearch(startX, startY, direction, trackGrid):
+    """
+    This function sets up the state space the lap searches run over, with the start/finish line cut out of the track.
+
+    Parameters:
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - direction (int): Heading of travel over the start/finish line.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - tuple or None: A tuple containing the traversable nodes as a flat bytearray, the grid height, the flat offset of each move,
+      the moves allowed after each move, the first node of the lap and the last node before the start, or None if no lap can start there.
+    """
+
+    width, height = trackGrid.shape
+    dirX, dirY = moveOffset(direction)
+    if not (0 <= startX < width - 2 and 0 <= startY < height - 2) or not trackGrid[startX, startY]:
+        return None
+
+    # Flatten the grid so every state is a single int, (x * height + y) * 8 + heading
+    # A bytearray keeps one byte per node so large grids stay small in memory
+    traversable = bytearray(trackGrid.astype(bool).tobytes())
+    for lineX, lineY in startLine(startX, startY, direction, trackGrid):
+        traversable[lineX * height + lineY] = 0
+
+    stepOffsets = [stepX * height + stepY for stepX, stepY in zip(headingX, headingY)]
+    nextMoves = nextHeadings
+
+    firstNode = (startX + dirX) * height + startY + dirY
+    # The lap has to come back over the line in the starting direction, so the last node before the start is directly behind it
+    lastNode = (startX - dirX) * height + startY - dirY
+    if not traversable[firstNode] or not traversable[lastNode]:
+        return None
+
+    return traversable, height, stepOffsets, nextMoves, firstNode, lastNode
+
+def findShortestLap(startX, startY, direction, trackGrid):
+    """
+    This function finds the shortest closed lap from a starting point in a specified direction with a breadth first search.
+
+    Every move turns at most one step from the current heading as in nextHeadings, so the search runs over (node, heading) states.
+    The start/finish line is removed from the track so the lap has to go all the way around before crossing it.
+
+    Parameters:
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - direction (int): Heading of travel over the start/finish line.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - tuple or None: A tuple containing two lists of X and Y coordinates from the node after the start back to the start, or None if no lap exists.
+    """
+
+    search = lapSearch(startX, startY, direction, trackGrid)
+    if search is None:
+        return None
+    traversable, height, stepOffsets, nextMoves, firstNode, lastNode = search
+
+    firstState = firstNode * 8 + direction
+    parents = {firstState: -1}
+    queue = deque([firstState])
+    lastState = None
+    while queue:
+        state = queue.popleft()
+        node, heading = divmod(state, 8)
+        if node == lastNode and direction in nextMoves[heading]:
+            lastState = state
+            break
+        for move in nextMoves[heading]:
+            nextNode = node + stepOffsets[move]
+            nextState = nextNode * 8 + move
+            if traversable[nextNode] and nextState not in parents:
+                parents[nextState] = state
+                queue.append(nextState)
+
+    # Every state reached was queued once, so the ones still queued are the only ones not expanded
+    count('statesExpanded', len(parents) - len(queue))
+
+    if lastState is None:
+        return None
+
+    # Walk the parents back to the first node
+    pathX = [startX]
+    pathY = [startY]
+    state = lastState
+    while state != -1:
+        node = state // 8
+        pathX.append(node // height)
+        pathY.append(node % height)
+        state = parents[state]
+
+    return pathX[::-1], pathY[::-1]
+
+def searchFrontier(backward, sharedNames, height, roots, barrier, meetFound, frontierEmpty, connection=None):
+    """
+    This function runs one side of findBidirectionalLap, expanding its frontier one level at a time in step with the other side.
+
+    Each side writes only its own parents. Between the two barrier waits of every level both sides only read,
+    so the new frontier can be checked against the other side's parents without any locking.
+    The forward side stores the heading of the state each state came from,
+    the backward side stores the heading of the state each state leads to on the way to the finish.
+
+    Parameters:
+    - backward (bool): True for the side searching back from the finish, False for the side searching forward from the start.
+    - sharedNames (tuple): Names of the shared memory holding the traversable nodes, the forward parents and the backward parents.
+    - height (int): Height of the track grid.
+    - roots (list): States the side starts from.
+    - barrier (multiprocessing.Barrier): Barrier both sides wait at twice every level.
+    - meetFound (multiprocessing.RawValue): Flag set once either side reaches a state the other side has visited.
+    - frontierEmpty (multiprocessing.RawValue): Flag set once either side runs out of states.
+    - connection (multiprocessing.connection.Connection): Pipe to send the meeting states over when run in its own process.
+
+    Returns:
+    - list: States the side reached in its last level that the other side has visited.
+    """
+
+    blocks = [shared_memory.SharedMemory(name=name) for name in sharedNames]
+    traversable = blocks[0].buf
+    ownParents, otherParents = (blocks[2].buf, blocks[1].buf) if backward else (blocks[1].buf, blocks[2].buf)
+
+    stepOffsets = [stepX * height + stepY for stepX, stepY in zip(headingX, headingY)]
+    nextMoves = nextHeadings
+    # Headings a state with each heading can be reached from
+    previousMoves = [[heading for heading in range(8) if move in nextMoves[heading]] for move in range(8)]
+
+    try:
+        for state in roots:
+            ownParents[state] = 8
+        frontier = roots
+        while True:
+            nextFrontier = []
+            for state in frontier:
+                node, heading = divmod(state, 8)
+                if backward:
+                    previousNode = node - stepOffsets[heading]
+                    if traversable[previousNode]:
+                        for previousHeading in previousMoves[heading]:
+                            previousState = previousNode * 8 + previousHeading
+                            if ownParents[previousState] == 255:
+                                ownParents[previousState] = heading
+                                nextFrontier.append(previousState)
+                else:
+                    for move in nextMoves[heading]:
+                        nextNode = node + stepOffsets[move]
+                        nextState = nextNode * 8 + move
+                        if traversable[nextNode] and ownParents[nextState] == 255:
+                            ownParents[nextState] = heading
+                            nextFrontier.append(nextState)
+
+            barrier.wait()
+            meets = [state for state in nextFrontier if otherParents[state] != 255]
+            if meets:
+                meetFound.value = 1
+            if not nextFrontier:
+                frontierEmpty.value = 1
+            barrier.wait()
+
+            if meetFound.value or frontierEmpty.value:
+                break
+            frontier = nextFrontier
+    except BaseException:
+        # Release the other side instead of leaving it waiting forever
+        barrier.abort()
+        raise
+    finally:
+        del traversable, ownParents, otherParents
+        for block in blocks:
+            block.close()
+
+    if connection is not None:
+        connection.send(meets)
+    return meets
+
+def findBidirectionalLap(startX, startY, direction, trackGrid):
+    """
+    This function finds the shortest closed lap by searching forward from the start and backward from the finish at the same time, on two processes.
+
+    Both searches run over the same (node, heading) states as findShortestLap and meet in the middle of the lap,
+    so each side only expands about half of the states. The track is shared with the second process through shared memory.
+
+    Parameters:
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - direction (int): Heading of travel over the start/finish line.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - tuple or None: A tuple containing two lists of X and Y coordinates from the node after the start back to the start, or None if no lap exists.
+    """
+
+    search = lapSearch(startX, startY, direction, trackGrid)
+    if search is None:
+        return None
+    traversable, height, stepOffsets, nextMoves, firstNode, lastNode = search
+
+    firstState = firstNode * 8 + direction
+    # The finish is the last node reached with any heading that can still move over the line in the starting direction
+    lastStates = [lastNode * 8 + heading for heading in range(8) if direction in nextMoves[heading]]
+
+    forwardParents = backwardParents = None
+    gridBlock = shared_memory.SharedMemory(create=True, size=len(traversable))
+    forwardBlock = shared_memory.SharedMemory(create=True, size=len(traversable) * 8)
+    backwardBlock = shared_memory.SharedMemory(create=True, size=len(traversable) * 8)
+    blocks = [gridBlock, forwardBlock, backwardBlock]
+    try:
+        gridBlock.buf[:len(traversable)] = traversable
+        forwardParents = np.ndarray(len(traversable) * 8, dtype=np.uint8, buffer=forwardBlock.buf)
+        backwardParents = np.ndarray(len(traversable) * 8, dtype=np.uint8, buffer=backwardBlock.buf)
+        forwardParents.fill(255)
+        backwardParents.fill(255)
+
+        sharedNames = tuple(block.name for block in blocks)
+        barrier = Barrier(2)
+        meetFound = RawValue('b', 0)
+        frontierEmpty = RawValue('b', 0)
+
+        receiver, sender = Pipe(duplex=False)
+        process = Process(target=searchFrontier, args=(True, sharedNames, height, lastStates, barrier, meetFound, frontierEmpty, sender))
+        process.start()
+        try:
+            forwardMeets = searchFrontier(False, sharedNames, height, [firstState], barrier, meetFound, frontierEmpty)
+            backwardMeets = receiver.recv()
+        except (BrokenBarrierError, EOFError):
+            raise RuntimeError('The backward search process stopped before the searches met.')
+        finally:
+            process.join()
+
+        if not forwardMeets and not backwardMeets:
+            return None
+
+        # A state both sides reached in the same level is as far from the start as from the finish.
+        # One only a single side reached in that level was reached a level earlier by the other, so its lap is one node shorter
+        forwardMeets = set(forwardMeets)
+        backwardMeets = set(backwardMeets)
+        meet = min((forwardMeets ^ backwardMeets) or forwardMeets)
+
+        # Walk the forward parents back to the start and the backward parents on to the finish
+        nodes = []
+        state = meet
+        while True:
+            node, heading = divmod(state, 8)
+            nodes.append(node)
+            previousHeading = int(forwardParents[state])
+            if previousHeading == 8:
+                break
+            state = (node - stepOffsets[heading]) * 8 + previousHeading
+        nodes.reverse()
+
+        state = meet
+        while int(backwardParents[state]) != 8:
+            nextHeading = int(backwardParents[state])
+            state = (state // 8 + stepOffsets[nextHeading]) * 8 + nextHeading
+            nodes.append(state // 8)
+    finally:
+        # The arrays hold on to the shared memory until they are dropped
+        forwardParents = backwardParents = None
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    pathX = [node // height for node in nodes] + [startX]
+    pathY = [node % height for node in nodes] + [startY]
+    return pathX, pathY
+
+def downsampleGrid(trackGrid):
+    """
+    This function halves the resolution of a track grid, each 2x2 block becoming one node when at least half of it is track.
+
+    A node (x, y) falls in the coarse node (x // 2, y // 2 + 1). The coarse grid keeps the empty border of buildTrackGrid.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - numpy.ndarray: Occupancy grid of the track at half the resolution.
+    """
+
+    width, height = trackGrid.shape
+    padded = np.zeros((width + width % 2, height + height % 2), dtype=np.uint8)
+    padded[:width, :height] = trackGrid
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).sum(axis=(1, 3))
+
+    coarseGrid = np.zeros((blocks.shape[0] + 2, blocks.shape[1] + 3), dtype=bool)
+    coarseGrid[:blocks.shape[0], 1:blocks.shape[1] + 1] = blocks >= 2
+    return coarseGrid
+
+def corridorGrid(coarseLap, coarseStart, coarseShape, radius, trackGrid):
+    """
+    This function keeps only the track nodes within a band around a lap found at half the resolution.
+
+    Parameters:
+    - coarseLap (tuple): Two lists of X and Y coordinates of the lap on the coarse grid.
+    - coarseStart (tuple): Coarse node the start falls in, always kept so the band reaches the start.
+    - coarseShape (tuple): Shape of the coarse grid.
+    - radius (int): Number of coarse nodes the band reaches to each side of the lap.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - numpy.ndarray: Occupancy grid holding only the track nodes inside the band.
+    """
+
+    lapX = np.append(coarseLap[0], coarseStart[0])
+    lapY = np.append(coarseLap[1], coarseStart[1])
+
+    # Widen the lap into a band by marking every coarse node within the radius of it
+    band = np.zeros(coarseShape, dtype=bool)
+    for offsetX in range(-radius, radius + 1):
+        for offsetY in range(-radius, radius + 1):
+            band[np.clip(lapX + offsetX, 0, coarseShape[0] - 1), np.clip(lapY + offsetY, 0, coarseShape[1] - 1)] = True
+
+    # Every coarse node covers a 2x2 block of the grid, the coarse Y-coordinates being shifted up by one
+    fineBand = band[:, 1:].repeat(2, axis=0).repeat(2, axis=1)
+    width, height = trackGrid.shape
+    corridor = np.zeros(trackGrid.shape, dtype=bool)
+    corridor[:min(width, fineBand.shape[0]), :min(height, fineBand.shape[1])] = fineBand[:width, :height]
+    return corridor & trackGrid
+
+def coarseGridChain(trackGrid, minSize=100):
+    """
+    This function halves a track grid with downsampleGrid again and again until it would be smaller than minSize.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - minSize (int): Smallest width or height a coarse grid may have. Defaults to 100.
+
+    Returns:
+    - list: Coarse grids from the finest to the coarsest, empty if trackGrid is already too small to halve.
+    """
+
+    coarseGrids = []
+    while max(trackGrid.shape) // 2 >= minSize:
+        trackGrid = downsampleGrid(trackGrid)
+        coarseGrids.append(trackGrid)
+    return coarseGrids
+
+def findMultiResolutionLap(startX, startY, direction, trackGrid, minSize=100, radius=2, coarseGrids=None):
+    """
+    This function finds a short closed lap by solving it on a coarser grid first and refining it at each finer resolution.
+
+    The grid is halved until it would be smaller than minSize. The lap found there is widened into a band and the
+    shortest lap inside that band is searched for on the next finer grid, so the fine searches only visit the track
+    close to the coarse lap. If a band is too narrow for a lap it is widened once, and the whole grid is searched if that fails too.
+
+    Parameters:
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - direction (int): Heading of travel over the start/finish line.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - minSize (int): Smallest width or height a coarse grid may have. Defaults to 100.
+    - radius (int): Number of coarse nodes the band reaches to each side of the coarse lap. Defaults to 2.
+    - coarseGrids (list): Coarse grids of trackGrid from coarseGridChain, built if not given so they can be reused across searches.
+
+    Returns:
+    - tuple or None: A tuple containing two lists of X and Y coordinates from the node after the start back to the start, or None if no lap exists.
+    """
+
+    if coarseGrids is None:
+        coarseGrids = coarseGridChain(trackGrid, minSize)
+    if not coarseGrids:
+        return findShortestLap(startX, startY, direction, trackGrid)
+
+    coarseGrid = coarseGrids[0]
+    coarseStart = (startX // 2, startY // 2 + 1)
+
+    # The start can fall in a block that was not kept, so the closest coarse node is used instead
+    coarseX, coarseY = np.nonzero(coarseGrid)
+    if len(coarseX) == 0:
+        return findShortestLap(startX, startY, direction, trackGrid)
+    closest = np.argmin((coarseX - coarseStart[0]) ** 2 + (coarseY - coarseStart[1]) ** 2)
+
+    coarseLap = findMultiResolutionLap(int(coarseX[closest]), int(coarseY[closest]), direction, coarseGrid, minSize, radius, coarseGrids[1:])
+    if coarseLap is not None:
+        for bandRadius in (radius, radius * 2):
+            corridor = corridorGrid(coarseLap, coarseStart, coarseGrid.shape, bandRadius, trackGrid)
+            lap = findShortestLap(startX, startY, direction, corridor)
+            if lap is not None:
+                return lap
+
+    return findShortestLap(startX, startY, direction, trackGrid)
+
+def findLap(x, y, direction, trackGrid, mode='greedy', clearance=None, minClearance=0, searchCache=None):
+    """
+    This function finds a lap from a starting point in a specified direction without rendering it.
+    In 'greedy' mode paths are explored in two directions and the best parts of each are stitched together,
+    in 'optimal' mode the shortest closed lap is found in one pass with findShortestLap and
+    in 'skeleton' mode the shortest lap along the center line is found on the much smaller skeleton graph with findSkeletonLap
+    in 'multiresolution' mode a short lap is refined from coarser grids with findMultiResolutionLap
+    and in 'bidirectional' mode the shortest lap is searched for from both ends at once on two processes with findBidirectionalLap.
+
+    Parameters:
+    - x (int): X-coordinate of the starting point.
+    - y (int): Y-coordinate of the starting point.
+    - direction (int): Initial heading of movement.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - mode (str): Search mode, either 'greedy', 'optimal', 'skeleton', 'multiresolution' or 'bidirectional'. Defaults to 'greedy'.
+    - clearance (numpy.ndarray): Clearance grid from trackClearance. Built from trackGrid if it is needed and not given.
+    - minClearance (float): Distance in track nodes the lap keeps from the edge of the track, a node on the edge has a clearance of 1. Defaults to no limit.
+    - searchCache (dict): Dictionary the grids and graphs built from trackGrid for a search are kept in, so later searches on the same track
+      reuse them. Only pass the same dictionary with the same trackGrid. Defaults to building them for this search only.
+
+    Returns:
+    - tuple or None: A tuple containing two lists of X and Y coordinates representing the lap, or None if no lap is found.
+    """
+
+    if searchCache is None:
+        searchCache = {}
+
+    if minClearance > 0:
+        if ('grid', minClearance) not in searchCache:
+            if clearance is None:
+                clearance = buildClearance(trackGrid)
+            # Every search runs on the nodes far enough from the edge, so each of them keeps the clearance without checking it
+            searchCache['grid', minClearance] = trackGrid & (clearance >= minClearance)
+        trackGrid = searchCache['grid', minClearance]
+
+    # What the skeleton and coarse to fine searches build depends only on the grid, not on the start
+    if mode == 'skeleton' and ('skeleton', minClearance) not in searchCache:
+        with stage('precompute'):
+            searchCache['skeleton', minClearance] = buildSkeletonGraph(trackGrid)
+    if mode == 'multiresolution' and ('coarseGrids', minClearance) not in searchCache:
+        with stage('precompute'):
+            searchCache['coarseGrids', minClearance] = coarseGridChain(trackGrid)
+
+    # Search and stitch are timed apart, and the search is profiled when RACELINE_PROFILE is set
+    with stage('search'), profiled(f'search-{mode}'):
+        if mode == 'optimal':
+            print('\nSearching for the shortest lap...')
+            return findShortestLap(x,y,direction,trackGrid)
+
+        if mode == 'skeleton':
+            print('\nSearching the track skeleton...')
+            return findSkeletonLap(x,y,direction,trackGrid,searchCache['skeleton', minClearance])
+
+        if mode == 'multiresolution':
+            print('\nSearching from coarse to fine...')
+            return findMultiResolutionLap(x,y,direction,trackGrid,coarseGrids=searchCache['coarseGrids', minClearance])
+
+        if mode == 'bidirectional':
+            print('\nSearching from the start and the finish at once...')
+            return findBidirectionalLap(x,y,direction,trackGrid)
+
+        j, i = moveOffset(direction)
+
+        print('\nSearching direction 1...')
+        resultsDir1 = findStart(x,y,direction,x+j,y+i,trackGrid) # Goes the wanted direction
+
+        print('Searching direction 2...')
+        resultsDir2 = findStart(x+j,y+i,oppositeHeadings[direction],x,y,trackGrid) # Goes the opposite direction
+
+    with stage('stitch'):
+        maxDist = -1e7
+        maxDistCoord = None
+        maxDistIndex = 0
+
+        # Get the max distance away 
+        for index in range(len(resultsDir2[0])):
+            coordX = resultsDir2[0][index]
+            coordY = resultsDir2[1][index]
+            xDist = abs(x - coordX)
+            yDist = abs(y - coordY)
+            dist = xDist + yDist
+            if dist > maxDist:
+                maxDist = dist
+                maxDistCoord = (coordX,coordY)
+                maxDistIndex = index
+
+        if maxDistCoord is None:
+            return None
+
+        dir2Index = maxDistIndex
+
+        # Check distance for the other direction
+        dir1Index = 0
+        for dirIndex in range(len(resultsDir1[0])):
+            if resultsDir1[0][dirIndex] == maxDistCoord[0] and resultsDir1[1][dirIndex] == maxDistCoord[1]:
+                dir1Index = dirIndex
+                break
+
+        if dir1Index == 0:
+            return None
+
+        # Get the best parts of each direction
+        half1X = resultsDir2[0][dir2Index:-1]
+        half1Y = resultsDir2[1][dir2Index:-1]
+        half2X = resultsDir1[0][dir1Index:-1]
+        half2Y = resultsDir1[1][dir1Index:-1]
+
+        return (half1X[::-1] + half2X,half1Y[::-1] + half2Y) # Stitches the better parts of each together
@@ -0,0 +1,55 @@
+from trackKernels import buildTrack, buildTrackGrid, findLap, trackClearance
+
+class TrackSession:
+    """
+    Keeps one track in memory with everything built from it, so every search after the first one on the track only pays for the search.
+
+    The track nodes, the occupancy grid, the clearance and what the search modes build from the grid, such as the skeleton graph
+    and the coarse grids, are built once and reused by every later search, whatever its start point, direction or mode.
+    """
+
+    def __init__(self, imagePath, size, threshold=150):
+        """
+        Builds the track nodes and occupancy grid of a track image scaled to a given size.
+
+        Parameters:
+        - imagePath (str): Path to the track image.
+        - size (int): Size the image is scaled to.
+        - threshold (int): Luminance threshold to classify a pixel as black. Defaults to 150.
+        """
+
+        self.imagePath = imagePath
+        self.size = size
+        self.threshold = threshold
+        self.xCoords, self.yCoords, self.totalNodes = buildTrack(imagePath, size, threshold)
+        self.trackGrid = buildTrackGrid(self.xCoords, self.yCoords)
+        self.searchCache = {}
+        self._clearance = None
+
+    @property
+    def clearance(self):
+        """
+        Clearance of every track node from trackClearance, loaded or built the first time it is used.
+        """
+
+        if self._clearance is None:
+            self._clearance = trackClearance(self.trackGrid, self.imagePath, self.size, self.threshold)
+        return self._clearance
+
+    def findLap(self, x, y, direction, mode='greedy', minClearance=0):
+        """
+        Finds a lap on the track with findLap, reusing everything earlier searches on the track built.
+
+        Parameters:
+        - x (int): X-coordinate of the starting point.
+        - y (int): Y-coordinate of the starting point.
+        - direction (int): Initial heading of movement.
+        - mode (str): Search mode, either 'greedy', 'optimal', 'skeleton', 'multiresolution' or 'bidirectional'. Defaults to 'greedy'.
+        - minClearance (float): Distance in track nodes the lap keeps from the edge of the track. Defaults to no limit.
+
+        Returns:
+        - tuple or None: A tuple containing two lists of X and Y coordinates representing the lap, or None if no lap is found.
+        """
+
+        clearance = self.clearance if minClearance > 0 else None
+        return findLap(x, y, direction, self.trackGrid, mode, clearance, minClearance, self.searchCache)
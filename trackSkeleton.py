@@ -0,0 +1,329 @@
+import heapq
+import numpy as np
+from headings import headingX, headingY
+
+# Neighbor offsets in Zhang-Suen order P2 to P9, starting north and going clockwise
+neighborOffsets = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+
+def thinningTables():
+    """
+    Builds the lookup tables of the two Zhang-Suen sub-iterations over every arrangement of the eight neighbors.
+
+    Returns:
+    - tuple: Two boolean arrays indexed by the neighbor bits, True where the center node is removed.
+    """
+
+    first = np.zeros(256, dtype=bool)
+    second = np.zeros(256, dtype=bool)
+    for code in range(256):
+        p2, p3, p4, p5, p6, p7, p8, p9 = [(code >> bit) & 1 for bit in range(8)]
+        neighbors = p2 + p3 + p4 + p5 + p6 + p7 + p8 + p9
+        sequence = [p2, p3, p4, p5, p6, p7, p8, p9, p2]
+        transitions = sum(1 for index in range(8) if sequence[index] == 0 and sequence[index + 1] == 1)
+        if 2 <= neighbors <= 6 and transitions == 1:
+            first[code] = p2 * p4 * p6 == 0 and p4 * p6 * p8 == 0
+            second[code] = p2 * p4 * p8 == 0 and p2 * p6 * p8 == 0
+    return first, second
+
+firstPass, secondPass = thinningTables()
+
+def neighborCodes(flatGrid, nodes, offsets):
+    """
+    Packs the eight neighbors of each of the given nodes into one byte.
+
+    Parameters:
+    - flatGrid (numpy.ndarray): Flattened boolean grid with at least a one node border of False.
+    - nodes (numpy.ndarray): Flat indexes of the nodes.
+    - offsets (numpy.ndarray): Flat index offsets of the neighbors in neighborOffsets order.
+
+    Returns:
+    - numpy.ndarray: Neighbor bits of every node.
+    """
+
+    codes = np.zeros(len(nodes), dtype=np.uint8)
+    for bit, offset in enumerate(offsets):
+        codes |= flatGrid[nodes + offset].astype(np.uint8) << bit
+    return codes
+
+def skeletonize(trackGrid):
+    """
+    Thins the track down to its one node wide center line with the Zhang-Suen algorithm.
+
+    Both sub-iterations are table lookups over the packed neighbors. Only nodes on the edge of what is left of the
+    track are looked at, and a node only joins that edge when a neighbor is removed, so thinning costs about one
+    visit per track node instead of one per node per pass. Diagonal staircases the thinning leaves behind are removed
+    afterwards so every node on a corridor has exactly two neighbors.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - numpy.ndarray: Boolean grid the same shape as trackGrid, True on the skeleton.
+    """
+
+    # buildTrackGrid leaves a border of empty nodes so the neighbor lookups stay in bounds
+    grid = trackGrid.astype(bool)
+    flatGrid = grid.ravel()
+    height = grid.shape[1]
+    offsets = np.array([stepX * height + stepY for stepX, stepY in neighborOffsets])
+
+    # Interior nodes have all eight neighbors and can never be removed
+    nodes = np.flatnonzero(flatGrid)
+    edgeNodes = nodes[neighborCodes(flatGrid, nodes, offsets) != 255]
+
+    passesWithoutChange = 0
+    table = 0
+    while passesWithoutChange < 2:
+        # Every node of a sub-iteration is judged before any of them is removed
+        remove = (firstPass, secondPass)[table][neighborCodes(flatGrid, edgeNodes, offsets)]
+        table = 1 - table
+        if not remove.any():
+            passesWithoutChange += 1
+            continue
+        passesWithoutChange = 0
+
+        removed = edgeNodes[remove]
+        flatGrid[removed] = False
+        exposed = (removed[:, None] + offsets).ravel()
+        edgeNodes = np.union1d(edgeNodes[~remove], exposed[flatGrid[exposed]])
+
+    nodesX, nodesY = np.divmod(np.flatnonzero(flatGrid), height)
+
+    # Staircase nodes whose neighbors are still connected without them are removed one at a time
+    for nodeX, nodeY in zip(nodesX.tolist(), nodesY.tolist()):
+        neighbors = [(stepX, stepY) for stepX, stepY in neighborOffsets if grid[nodeX + stepX, nodeY + stepY]]
+        if len(neighbors) >= 2 and neighborGroups(neighbors) == 1:
+            grid[nodeX, nodeY] = False
+
+    return grid
+
+def neighborGroups(neighbors):
+    """
+    Counts the groups the neighbors of a node fall into when they are joined to each other but not through the node.
+
+    Parameters:
+    - neighbors (list): Offsets of the neighbors that are on the skeleton.
+
+    Returns:
+    - int: Number of connected groups of neighbors.
+    """
+
+    remaining = set(neighbors)
+    groups = 0
+    while remaining:
+        groups += 1
+        stack = [remaining.pop()]
+        while stack:
+            stepX, stepY = stack.pop()
+            for other in list(remaining):
+                if abs(other[0] - stepX) <= 1 and abs(other[1] - stepY) <= 1:
+                    remaining.remove(other)
+                    stack.append(other)
+    return groups
+
+def buildSkeletonGraph(trackGrid):
+    """
+    Collapses the skeleton of the track into a graph whose nodes are junctions and dead ends and whose edges are corridors.
+
+    A loop of corridor without any junction gets one of its nodes promoted to a graph node so it still has an edge.
+
+    Parameters:
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+
+    Returns:
+    - dict: The graph with:
+        - 'nodes': List of (x, y) coordinates of the graph nodes.
+        - 'nodeIndex': Dictionary of coordinates to graph node index.
+        - 'edges': List of (from node, to node, coordinates) with the coordinates of every skeleton node along the edge.
+        - 'adjacency': List holding the indexes of the edges at each graph node.
+        - 'edgeNodes': Dictionary of the coordinates inside each edge to its (edge index, position along the edge).
+        - 'skeletonX', 'skeletonY': Arrays of the X and Y coordinates of every skeleton node.
+    """
+
+    skeleton = skeletonize(trackGrid)
+    skeletonX, skeletonY = np.nonzero(skeleton)
+    points = set(zip(skeletonX.tolist(), skeletonY.tolist()))
+
+    def neighborsOf(point):
+        return [(point[0] + stepX, point[1] + stepY) for stepX, stepY in neighborOffsets if (point[0] + stepX, point[1] + stepY) in points]
+
+    graph = {'nodes': [], 'nodeIndex': {}, 'edges': [], 'adjacency': [], 'edgeNodes': {}, 'skeletonX': skeletonX, 'skeletonY': skeletonY}
+
+    def addNode(point):
+        graph['nodeIndex'][point] = len(graph['nodes'])
+        graph['nodes'].append(point)
+        graph['adjacency'].append([])
+
+    for point in sorted(points):
+        if len(neighborsOf(point)) != 2:
+            addNode(point)
+
+    walked = set()
+    def traceEdges(node):
+        # Follow every corridor out of the node until it reaches another graph node
+        point = graph['nodes'][node]
+        for nextPoint in neighborsOf(point):
+            if (point, nextPoint) in walked:
+                continue
+            edge = [point, nextPoint]
+            while edge[-1] not in graph['nodeIndex']:
+                following = [other for other in neighborsOf(edge[-1]) if other != edge[-2]]
+                edge.append(following[0])
+            walked.add((point, nextPoint))
+            walked.add((edge[-1], edge[-2]))
+
+            edgeIndex = len(graph['edges'])
+            graph['edges'].append((node, graph['nodeIndex'][edge[-1]], edge))
+            graph['adjacency'][node].append(edgeIndex)
+            if edge[-1] != point:
+                graph['adjacency'][graph['nodeIndex'][edge[-1]]].append(edgeIndex)
+            for position in range(1, len(edge) - 1):
+                graph['edgeNodes'][edge[position]] = (edgeIndex, position)
+
+    for node in range(len(graph['nodes'])):
+        traceEdges(node)
+
+    # Loops with no junction on them
+    for point in sorted(points):
+        if point not in graph['nodeIndex'] and point not in graph['edgeNodes']:
+            addNode(point)
+            traceEdges(len(graph['nodes']) - 1)
+
+    return graph
+
+def edgeOtherEnd(edge, node):
+    """
+    Gets the node at the far end of an edge.
+
+    Parameters:
+    - edge (tuple): Edge from the graph.
+    - node (int): Graph node at one end of the edge.
+
+    Returns:
+    - int: Graph node at the other end.
+    """
+
+    return edge[1] if edge[0] == node else edge[0]
+
+def edgeFrom(edge, node):
+    """
+    Gets the coordinates along an edge starting from one of its ends.
+
+    Parameters:
+    - edge (tuple): Edge from the graph.
+    - node (int): Graph node the coordinates start at.
+
+    Returns:
+    - list: Coordinates along the edge from the node.
+    """
+
+    return edge[2] if edge[0] == node else edge[2][::-1]
+
+def shortestRoute(graph, fromNode, toNode, skipEdge):
+    """
+    Finds the shortest route between two graph nodes with Dijkstra's algorithm, each edge weighing the number of moves along it.
+
+    Parameters:
+    - graph (dict): Skeleton graph from buildSkeletonGraph.
+    - fromNode (int): Graph node the route starts at.
+    - toNode (int): Graph node the route ends at.
+    - skipEdge (int): Index of an edge the route may not use.
+
+    Returns:
+    - list or None: Indexes of the edges along the route in order, or None if the nodes are not connected.
+    """
+
+    distances = {fromNode: 0}
+    parents = {fromNode: None}
+    queue = [(0, fromNode)]
+    while queue:
+        distance, node = heapq.heappop(queue)
+        if node == toNode:
+            break
+        if distance > distances[node]:
+            continue
+        for edgeIndex in graph['adjacency'][node]:
+            if edgeIndex == skipEdge:
+                continue
+            edge = graph['edges'][edgeIndex]
+            nextNode = edgeOtherEnd(edge, node)
+            nextDistance = distance + len(edge[2]) - 1
+            if nextDistance < distances.get(nextNode, float('inf')):
+                distances[nextNode] = nextDistance
+                parents[nextNode] = (node, edgeIndex)
+                heapq.heappush(queue, (nextDistance, nextNode))
+
+    if toNode not in parents:
+        return None
+
+    route = []
+    node = toNode
+    while parents[node] is not None:
+        node, edgeIndex = parents[node]
+        route.append(edgeIndex)
+    return route[::-1]
+
+def findSkeletonLap(startX, startY, direction, trackGrid, graph=None):
+    """
+    This function finds the shortest lap along the center line of the track, searching the skeleton graph instead of every track node.
+
+    The lap runs through the skeleton node closest to the start, leaving it on the side that best matches the direction.
+    The route found between graph nodes is expanded back into the coordinates of every skeleton node along it.
+
+    Parameters:
+    - startX (int): Starting X-coordinate.
+    - startY (int): Starting Y-coordinate.
+    - direction (int): Heading ID of the direction of travel.
+    - trackGrid (numpy.ndarray): Occupancy grid of the track from buildTrackGrid.
+    - graph (dict): Skeleton graph from buildSkeletonGraph, built from trackGrid if not given so it can be reused across searches.
+
+    Returns:
+    - tuple or None: A tuple containing two lists of X and Y coordinates from the node after the lap's start back to it, or None if no lap exists.
+    """
+
+    if graph is None:
+        graph = buildSkeletonGraph(trackGrid)
+    if len(graph['skeletonX']) == 0:
+        return None
+
+    dirX, dirY = headingX[direction], headingY[direction]
+    closest = np.argmin((graph['skeletonX'] - startX) ** 2 + (graph['skeletonY'] - startY) ** 2)
+    point = (int(graph['skeletonX'][closest]), int(graph['skeletonY'][closest]))
+
+    def heading(coords):
+        return (coords[0] - point[0]) * dirX + (coords[1] - point[1]) * dirY
+
+    if point in graph['nodeIndex']:
+        # Leave the graph node along the edge that points closest to the direction and come back over any other edge
+        node = graph['nodeIndex'][point]
+        if not graph['adjacency'][node]:
+            return None
+        forwardEdge = max(graph['adjacency'][node], key=lambda edgeIndex: heading(edgeFrom(graph['edges'][edgeIndex], node)[1]))
+        forward = edgeFrom(graph['edges'][forwardEdge], node)
+        backward = [point]
+        fromNode = edgeOtherEnd(graph['edges'][forwardEdge], node)
+        toNode = node
+    else:
+        # Split the edge at the start and go around from the end ahead of it to the end behind it
+        forwardEdge, position = graph['edgeNodes'][point]
+        edgeStart, edgeEnd, coords = graph['edges'][forwardEdge]
+        if heading(coords[position + 1]) >= heading(coords[position - 1]):
+            forward, backward, fromNode, toNode = coords[position:], coords[:position + 1], edgeEnd, edgeStart
+        else:
+            forward, backward, fromNode, toNode = coords[position::-1], coords[position:][::-1], edgeStart, edgeEnd
+
+    route = shortestRoute(graph, fromNode, toNode, forwardEdge)
+    if route is None:
+        return None
+
+    # Expand the route back into skeleton coordinates, each edge adding every node after its first
+    lap = list(forward)
+    node = fromNode
+    for edgeIndex in route:
+        edge = graph['edges'][edgeIndex]
+        lap += edgeFrom(edge, node)[1:]
+        node = edgeOtherEnd(edge, node)
+    lap += backward[1:]
+
+    pathX, pathY = zip(*lap[1:])
+    return list(pathX), list(pathY)